@@ -1,121 +1,54 @@
 # agent_logic.py
-from openai import OpenAI
-from tools import get_projects, add_lead_to_crm, send_otp, verify_otp
-from system_prompt import SYSTEM_PROMPT
+from openai import OpenAI, AsyncOpenAI
+from tools import get_catalog, get_catalog_async, add_catalog_listener
+from crm_outbox import enqueue_lead, start_outbox_worker
+from project_matcher import get_matcher, confident_match
+from project_retrieval import select_relevant_projects
+from system_prompt import build_static_prompt, build_lead_status_prompt
 from conversation_logger import log_conversation
+from session_store import get_session_store, new_session_id
+from conversation_context import trim_history, build_messages
+from block_stream import BlockStreamParser
+from stage_machine import Message, advance, capture_requirements
+from stage_templates import render_scripted_reply
+from response_cache import get_response_cache, faq_query, cache_key, mentions_visitor, RESPONSE_CACHE_ENABLED
+import asyncio
 import json
-import re
-import uuid
 
 client = OpenAI()
+async_client = AsyncOpenAI()
+
+MODEL_NAME = "gpt-4o-mini"
 
 # -----------------------
 # MEMORY & LEAD STATE
 # -----------------------
+# Conversation history, stage and lead data live per session in the session
+# store (see session_store.py). Stages and their transitions are defined in
+# stage_machine.py.
+session_store = get_session_store()
+
+# Deliver leads left in the CRM outbox by a previous run
+start_outbox_worker()
 
-# Generate unique session ID
-session_id = str(uuid.uuid4())
-
-conversation_history = []
-conversation_stage = "INITIAL"  # INITIAL, NAME_COLLECTED, PHONE_COLLECTED, OTP_SENT, VERIFIED, REQUIREMENT_GATHERING
-
-lead_data = {
-    "customer_type": None,  # "existing" or "new"
-    "name": None,
-    "phone": None,
-    "phone_verified": False,
-    "otp_sent": False,
-    "interested_project_id": None,
-    "interested_project_name": None,
-    "lead_submitted": False,
-    "conversation_remarks": [],
-    "requirements": {
-        "purpose": None,
-        "budget": None,
-        "possession": None,
-        "configuration": None
-    }
-}
+# Cached FAQ answers may quote prices or details of the old catalog
+response_cache = get_response_cache()
+add_catalog_listener(response_cache.invalidate)
 
 # =========================
 # HELPERS
 # =========================
-def extract_name_from_message(message):
-    """Extract name from user message"""
-    words = message.strip().split()
-    common_phrases = ['hi', 'hello', 'yes', 'no', 'okay', 'sure', 'my', 'name', 'is', 'i', 'am', 'the']
-    
-    # Filter out common phrases
-    potential_name = ' '.join([w for w in words if w.lower() not in common_phrases])
-    
-    if potential_name and len(potential_name) > 1:
-        return potential_name.strip().title()
-    
-    # Try regex pattern
-    match = re.search(r"(?:my name is|i am|i'm|this is) (\w+(?:\s+\w+)?)", message, re.IGNORECASE)
+def extract_project_interest(project_matches):
+    """Project the user message refers to, from this turn's matcher candidates"""
+    match = confident_match(project_matches)
     if match:
-        return match.group(1).title()
-    
-    # If message is just a name (single or two words)
-    if len(words) <= 2 and all(w[0].isupper() or w.lower() not in common_phrases for w in words):
-        return message.strip().title()
-    
-    return None
-
-def extract_phone_from_message(message):
-    """Extract 10-digit phone number from message"""
-    # Remove all non-digits
-    digits = re.sub(r'\D', '', message)
-    
-    # Handle country code +91
-    if digits.startswith('91') and len(digits) > 10:
-        digits = digits[2:]  # Remove 91 prefix
-    
-    # Handle leading zero
-    if digits.startswith('0') and len(digits) > 10:
-        digits = digits[1:]  # Remove leading 0
-    
-    # Check if exactly 10 digits
-    if len(digits) == 10:
-        print(f"✅ Valid phone extracted: {digits}")
-        return digits
+        print(f"🎯 Project detected in user message: {match.project.name} ({match.kind} '{match.term}', score {match.score})")
+        return {"id": match.project.id, "name": match.project.name}
     
-    print(f"❌ Invalid phone: {digits} (length: {len(digits)})")
     return None
 
-def safe_parse_projects(projects_str):
-    """Safely parse projects string to list"""
-    try:
-        if isinstance(projects_str, str):
-            return json.loads(projects_str.replace("'", '"'))
-        return projects_str
-    except:
-        return []
-
-def extract_project_interest(message, projects_str):
-    """Extract project interest from user message"""
-    message_lower = message.lower()
-    projects = safe_parse_projects(projects_str)
-    
-    for p in projects:
-        pname = p.get("name", "").lower()
-        if pname and pname in message_lower:
-            print(f"🎯 Project detected in user message: {p.get('name')}")
-            return {"id": p.get("id"), "name": p.get("name")}
-    
-    return None
-
-def check_customer_type(message):
-    """Check if user selected customer type"""
-    message_lower = message.lower()
-    if "existing" in message_lower or "already" in message_lower or "client" in message_lower:
-        return "existing"
-    elif "new" in message_lower or "guest" in message_lower or "first time" in message_lower:
-        return "new"
-    return None
-
-def check_and_submit_lead():
-    """Check if all required fields are present and submit lead to CRM"""
+def check_and_submit_lead(lead_data, session_id=None):
+    """Check if all required fields are present and queue the lead for the CRM"""
     print("\n" + "="*60)
     print("🔍 CHECKING LEAD SUBMISSION CONDITIONS:")
     print(f"   Name: {lead_data['name']}")
@@ -133,27 +66,28 @@ def check_and_submit_lead():
         lead_data["interested_project_id"] and 
         not lead_data["lead_submitted"]
     ):
-        print("\n✅ ALL CONDITIONS MET - SUBMITTING LEAD TO CRM...")
+        print("\n✅ ALL CONDITIONS MET - QUEUING LEAD FOR CRM...")
         
         # Prepare remarks
         requirements_text = ", ".join([f"{k}: {v}" for k, v in lead_data["requirements"].items() if v])
         remarks = " | ".join(lead_data["conversation_remarks"]) + f" | Requirements: {requirements_text}"
         
-        # Call CRM API
-        result = add_lead_to_crm(
-            name=lead_data["name"],
-            phone=lead_data["phone"],
-            project_id=lead_data["interested_project_id"],
-            remarks=remarks
-        )
-        
-        if result.get("status") == "success":
-            lead_data["lead_submitted"] = True
-            print("\n🎉 ✅ LEAD SUCCESSFULLY SUBMITTED TO CRM!")
-            return True
-        else:
-            print(f"\n❌ LEAD SUBMISSION FAILED: {result.get('message')}")
+        # Durable outbox: the worker delivers it (with retries) off the chat turn
+        try:
+            enqueue_lead(
+                session_id,
+                name=lead_data["name"],
+                phone=lead_data["phone"],
+                project_id=lead_data["interested_project_id"],
+                remarks=remarks
+            )
+        except Exception as e:
+            print(f"\n❌ LEAD COULD NOT BE QUEUED: {e}")
             return False
+        
+        lead_data["lead_submitted"] = True
+        print("\n🎉 ✅ LEAD QUEUED FOR CRM DELIVERY!")
+        return True
     else:
         print("\n⏳ CONDITIONS NOT MET YET - WAITING FOR MORE INFO...")
         return False
@@ -161,69 +95,212 @@ def check_and_submit_lead():
 # =========================
 # MAIN CONVERSATION
 # =========================
-def run_conversation(user_prompt):
-    global conversation_history, lead_data, conversation_stage
+def run_conversation(user_prompt, session_id=None):
+    """Run one chat turn for a session and return the JSON blocks reply"""
+    session = session_store.get(session_id or new_session_id())
+    try:
+        messages, ready_reply, faq_key = _prepare_turn(session, user_prompt, get_catalog())
+        if ready_reply:
+            check_and_submit_lead(session.lead, session.session_id)
+            return _finish_turn(session, user_prompt, ready_reply)
+
+        # ----------------- AI CALL -----------------
+        print("\n🤖 CALLING AI MODEL...\n")
+        try:
+            response = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=0.3
+            )
+            ai_reply = response.choices[0].message.content
+            print(f"🤖 AI RESPONSE: {ai_reply}\n")
+
+            # ----------------- AUTO CRM SUBMIT -----------------
+            check_and_submit_lead(session.lead, session.session_id)
+
+            return _finish_turn(session, user_prompt, ai_reply, faq_key)
+
+        except Exception as e:
+            return _error_reply(e)
+    finally:
+        session_store.save(session)
+
+
+async def run_conversation_async(user_prompt, session_id=None):
+    """Async variant of run_conversation for the ASGI app.
+
+    The model call goes through AsyncOpenAI; blocking work (session store,
+    cold catalog fetch, CRM submission) runs in worker threads so the event
+    loop keeps serving other chats while this one waits on I/O.
+    """
+    session = await asyncio.to_thread(session_store.get, session_id or new_session_id())
+    try:
+        # Stage actions may call send_otp/verify_otp, which can block on Redis
+        messages, ready_reply, faq_key = await asyncio.to_thread(
+            _prepare_turn, session, user_prompt, await get_catalog_async()
+        )
+        if ready_reply:
+            await asyncio.to_thread(check_and_submit_lead, session.lead, session.session_id)
+            return _finish_turn(session, user_prompt, ready_reply)
+
+        # ----------------- AI CALL -----------------
+        print("\n🤖 CALLING AI MODEL (async)...\n")
+        try:
+            response = await async_client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=0.3
+            )
+            ai_reply = response.choices[0].message.content
+            print(f"🤖 AI RESPONSE: {ai_reply}\n")
+
+            # ----------------- AUTO CRM SUBMIT -----------------
+            await asyncio.to_thread(check_and_submit_lead, session.lead, session.session_id)
+
+            return _finish_turn(session, user_prompt, ai_reply, faq_key)
+
+        except Exception as e:
+            return _error_reply(e)
+    finally:
+        await asyncio.to_thread(session_store.save, session)
+
+
+def run_conversation_stream(user_prompt, session_id=None):
+    """Streaming variant of run_conversation.
+
+    Yields each reply block (dict) as soon as the model has finished writing
+    it. CRM submission, history and logging run once the reply is complete.
+    """
+    session = session_store.get(session_id or new_session_id())
+    try:
+        messages, ready_reply, faq_key = _prepare_turn(session, user_prompt, get_catalog())
+        if ready_reply:
+            check_and_submit_lead(session.lead, session.session_id)
+            for block in _reply_blocks(_finish_turn(session, user_prompt, ready_reply)):
+                yield block
+            return
+
+        print("\n🤖 STREAMING AI MODEL...\n")
+        parser = BlockStreamParser()
+        try:
+            stream = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=0.3,
+                stream=True
+            )
+            for chunk in stream:
+                for block in parser.feed(_chunk_text(chunk)):
+                    yield block
+            print(f"🤖 AI RESPONSE: {parser.text}\n")
+
+            check_and_submit_lead(session.lead, session.session_id)
+
+            ai_reply = _finish_turn(session, user_prompt, parser.text, faq_key)
+        except Exception as e:
+            # Blocks already sent stay on screen; the error always follows them
+            for block in _reply_blocks(_error_reply(e)):
+                yield block
+            return
+
+        # Anything the parser could not emit (e.g. a non-JSON reply that got wrapped)
+        for block in _reply_blocks(ai_reply)[parser.emitted:]:
+            yield block
+    finally:
+        session_store.save(session)
+
+
+async def run_conversation_stream_async(user_prompt, session_id=None):
+    """Async streaming variant, see run_conversation_stream"""
+    session = await asyncio.to_thread(session_store.get, session_id or new_session_id())
+    try:
+        # Stage actions may call send_otp/verify_otp, which can block on Redis
+        messages, ready_reply, faq_key = await asyncio.to_thread(
+            _prepare_turn, session, user_prompt, await get_catalog_async()
+        )
+        if ready_reply:
+            await asyncio.to_thread(check_and_submit_lead, session.lead, session.session_id)
+            for block in _reply_blocks(_finish_turn(session, user_prompt, ready_reply)):
+                yield block
+            return
+
+        print("\n🤖 STREAMING AI MODEL (async)...\n")
+        parser = BlockStreamParser()
+        try:
+            stream = await async_client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=0.3,
+                stream=True
+            )
+            async for chunk in stream:
+                for block in parser.feed(_chunk_text(chunk)):
+                    yield block
+            print(f"🤖 AI RESPONSE: {parser.text}\n")
+
+            await asyncio.to_thread(check_and_submit_lead, session.lead, session.session_id)
+
+            ai_reply = _finish_turn(session, user_prompt, parser.text, faq_key)
+        except Exception as e:
+            for block in _reply_blocks(_error_reply(e)):
+                yield block
+            return
+
+        for block in _reply_blocks(ai_reply)[parser.emitted:]:
+            yield block
+    finally:
+        await asyncio.to_thread(session_store.save, session)
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def _reply_blocks(ai_reply):
+    try:
+        return json.loads(ai_reply).get("blocks", [])
+    except Exception:
+        return []
+
+
+def _prepare_turn(session, user_prompt, catalog):
+    """Update stage and lead data from the message.
+
+    catalog is (projects, version) from one read of the catalog cache, so the
+    matcher, the prompt and the FAQ key all see the same catalog.
+
+    Returns (model messages, None, FAQ cache key or None), or
+    (None, reply, None) when the turn lands on a fixed step of the flow or on
+    a cached FAQ answer and the model call can be skipped.
+    """
+    conversation_history = session.history
+    lead_data = session.lead
+    conversation_stage = session.stage
+    previous_stage = conversation_stage
+    first_turn = not conversation_history
+    known_project_id = lead_data["interested_project_id"]
 
     print(f"\n{'='*60}")
+    print(f"🆔 SESSION: {session.session_id}")
     print(f"💤 USER MESSAGE: {user_prompt}")
     print(f"📍 CURRENT STAGE: {conversation_stage}")
     print(f"{'='*60}\n")
 
-    projects = get_projects("")  # dynamic fetch
 
     # ----------------- STAGE MANAGEMENT -----------------
-    
-    # Check for customer type selection
-    if conversation_stage == "INITIAL":
-        customer_type = check_customer_type(user_prompt)
-        if customer_type:
-            lead_data["customer_type"] = customer_type
-            conversation_stage = "CUSTOMER_TYPE_SELECTED"
-    
-    # Extract Name
-    if conversation_stage in ["CUSTOMER_TYPE_SELECTED", "NAME_REQUEST"] and not lead_data["name"]:
-        name = extract_name_from_message(user_prompt)
-        if name:
-            lead_data["name"] = name
-            lead_data["conversation_remarks"].append(f"Name: {name}")
-            conversation_stage = "NAME_COLLECTED"
-            print(f"✅ Name captured: {name}")
-
-    # Extract Phone
-    if conversation_stage == "PHONE_REQUEST" and not lead_data["phone"]:
-        phone = extract_phone_from_message(user_prompt)
-        if phone:
-            lead_data["phone"] = phone
-            lead_data["conversation_remarks"].append(f"Phone: {phone}")
-            conversation_stage = "PHONE_COLLECTED"
-            print(f"✅ Phone captured: {phone}")
-            
-            # Trigger OTP sending
-            otp_result = send_otp(phone)
-            if otp_result.get("status") == "success":
-                lead_data["otp_sent"] = True
-                conversation_stage = "OTP_SENT"
-        elif len(user_prompt.replace(" ", "").replace("-", "")) < 10:
-            # Invalid phone detected
-            conversation_stage = "PHONE_INVALID"
-
-    # Check for OTP in message
-    if conversation_stage == "OTP_SENT" and lead_data["phone"]:
-        # Extract OTP (6 digits typically)
-        otp_match = re.search(r'\b\d{4,6}\b', user_prompt)
-        if otp_match:
-            otp = otp_match.group()
-            verify_result = verify_otp(lead_data["phone"], otp)
-            if verify_result.get("status") == "success":
-                lead_data["phone_verified"] = True
-                conversation_stage = "VERIFIED"
-                print(f"✅ Phone verified successfully")
-            else:
-                conversation_stage = "OTP_INVALID"
+    message = Message(user_prompt)
+    conversation_stage = advance(conversation_stage, message, lead_data)
+
+    # Match projects once; interest capture, the FAQ cache and the prompt's
+    # project selection all reuse the candidates
+    projects, catalog_version = catalog
+    project_matches = get_matcher(projects, catalog_version).match(user_prompt) if projects else []
 
     # Extract Project Interest
     if not lead_data["interested_project_id"]:
-        project = extract_project_interest(user_prompt, projects)
+        project = extract_project_interest(project_matches)
         if project:
             lead_data["interested_project_id"] = project["id"]
             lead_data["interested_project_name"] = project["name"]
@@ -231,75 +308,99 @@ def run_conversation(user_prompt):
             print(f"✅ Project interest captured: {project['name']}")
 
     # Extract Requirements from options selected
-    if "residential" in user_prompt.lower() or "investment" in user_prompt.lower() or "commercial" in user_prompt.lower():
-        lead_data["requirements"]["purpose"] = user_prompt
-    if "lakh" in user_prompt.lower() or "cr" in user_prompt.lower():
-        lead_data["requirements"]["budget"] = user_prompt
-    if "ready" in user_prompt.lower() or "year" in user_prompt.lower():
-        lead_data["requirements"]["possession"] = user_prompt
-    if "bhk" in user_prompt.lower() or "studio" in user_prompt.lower():
-        lead_data["requirements"]["configuration"] = user_prompt
+    capture_requirements(message, lead_data)
 
-    # ----------------- SYSTEM PROMPT -----------------
-    system_prompt = SYSTEM_PROMPT.format(
-        name=lead_data.get('name', 'NOT CAPTURED'),
-        phone=lead_data.get('phone', 'NOT CAPTURED'),
-        phone_verified=lead_data.get('phone_verified', False),
-        project_name=lead_data.get('interested_project_name', 'NOT IDENTIFIED'),
-        lead_submitted=lead_data.get('lead_submitted', False),
-        projects=json.dumps(projects, indent=2)
-    )
+    session.stage = conversation_stage
 
-    if not conversation_history:
-        conversation_history.append({"role": "system", "content": system_prompt})
-    
     # Add stage context to user message
     context_message = f"[STAGE: {conversation_stage}] {user_prompt}"
     conversation_history.append({"role": "user", "content": context_message})
 
-    # ----------------- AI CALL -----------------
-    print("\n🤖 CALLING AI MODEL...\n")
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=conversation_history,
-            temperature=0.3
-        )
-        ai_reply = response.choices[0].message.content
-        print(f"🤖 AI RESPONSE: {ai_reply}\n")
+    # Keep only recent turns verbatim; older ones are summarized from lead_data
+    trim_history(session)
 
-        # ----------------- AUTO CRM SUBMIT -----------------
-        check_and_submit_lead()
+    # ----------------- SCRIPTED STEPS -----------------
+    # A newly mentioned project needs the model's answer, not the next script step
+    if lead_data["interested_project_id"] == known_project_id:
+        scripted_reply = render_scripted_reply(previous_stage, conversation_stage, lead_data, user_prompt, first_turn)
+        if scripted_reply:
+            return None, scripted_reply, None
 
-        # ----------------- VALIDATE JSON -----------------
-        try:
-            json.loads(ai_reply)
-        except:
-            print("⚠️ Invalid JSON detected, wrapping in proper format...")
-            ai_reply = json.dumps({
-                "blocks": [{
-                    "component": "Text",
-                    "props": {"text": ai_reply}
-                }]
-            })
-
-        conversation_history.append({"role": "assistant", "content": ai_reply})
-        
-        # Log conversation with timestamp
-        log_conversation(
-            session_id=session_id,
-            user_message=user_prompt,
-            ai_response=ai_reply,
-            lead_data=lead_data
-        )
-        
-        return ai_reply
+    # ----------------- FAQ CACHE -----------------
+    faq_key = None
+    if conversation_stage == previous_stage:
+        faq_key = _faq_cache_key(user_prompt, project_matches, catalog_version, conversation_stage, lead_data)
+        cached_reply = response_cache.get(faq_key) if faq_key else None
+        if cached_reply:
+            print(f"⚡ Cached answer for '{faq_key[0]}' (no model call)")
+            return None, cached_reply, None
+
+    # ----------------- SYSTEM PROMPT -----------------
+    # Static prefix (instructions + catalog summary) is shared by every session
+    # of a catalog version; the lead state and the detailed projects for this
+    # turn go in a small message at the end so the prefix stays cacheable.
+    static_prompt = build_static_prompt(catalog_version, projects)
+    relevant_projects = select_relevant_projects(
+        projects, lead_data, user_prompt, version=catalog_version, matches=project_matches
+    )
+    lead_status_prompt = build_lead_status_prompt(lead_data, conversation_stage, relevant_projects)
 
-    except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
-        return json.dumps({
+    return build_messages(session, static_prompt, lead_status_prompt), None, faq_key
+
+
+def _faq_cache_key(user_prompt, project_matches, catalog_version, stage, lead_data):
+    """Response cache key if the message is an FAQ-style question, else None"""
+    if not RESPONSE_CACHE_ENABLED or not catalog_version:
+        return None
+    match = confident_match(project_matches)
+    query = faq_query(user_prompt, match.term if match else None)
+    if not query:
+        return None
+    project_id = match.project.id if match else None
+    return cache_key(query, project_id, catalog_version, stage, lead_data)
+
+
+def _finish_turn(session, user_prompt, ai_reply, faq_key=None):
+    """Validate the model reply, record it in history and the log"""
+    # ----------------- VALIDATE JSON -----------------
+    try:
+        json.loads(ai_reply)
+    except ValueError:
+        print("⚠️ Invalid JSON detected, wrapping in proper format...")
+        ai_reply = json.dumps({
             "blocks": [{
                 "component": "Text",
-                "props": {"text": f"I apologize, but I'm experiencing a technical issue. Please try again or call us at **+91 92500-94500**."}
+                "props": {"text": ai_reply}
             }]
-        })
\ No newline at end of file
+        })
+    else:
+        if faq_key:
+            # A cache problem must never change the reply itself
+            try:
+                if not mentions_visitor(ai_reply, session.lead):
+                    response_cache.put(faq_key, ai_reply)
+            except Exception as e:
+                print(f"⚠️ Could not cache answer: {str(e)}")
+
+    session.history.append({"role": "assistant", "content": ai_reply})
+    
+    # Log conversation with timestamp
+    log_conversation(
+        session_id=session.session_id,
+        user_message=user_prompt,
+        ai_response=ai_reply,
+        lead_data=session.lead.to_dict(),
+        stage=session.stage
+    )
+    
+    return ai_reply
+
+
+def _error_reply(e):
+    print(f"❌ ERROR: {str(e)}")
+    return json.dumps({
+        "blocks": [{
+            "component": "Text",
+            "props": {"text": f"I apologize, but I'm experiencing a technical issue. Please try again or call us at **+91 92500-94500**."}
+        }]
+    })
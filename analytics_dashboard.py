@@ -2,11 +2,18 @@
 """
 Run this script to view conversation analytics and logs
 Usage: python analytics_dashboard.py
+       python analytics_dashboard.py rebuild   # recompute analytics from raw logs
 """
 
-from conversation_logger import get_analytics, get_all_sessions, export_logs_csv, load_logs
+from conversation_logger import (
+    get_analytics, get_all_sessions, export_logs_csv, get_recent_logs, get_session_logs,
+    get_activity_rollups, rebuild_analytics, search_sessions
+)
+from funnel_analytics import get_funnel_report
+from crm_outbox import get_outbox_stats
 from datetime import datetime
 import json
+import sys
 
 def print_header(title):
     print("\n" + "="*60)
@@ -25,16 +32,68 @@ def display_analytics():
     print(f"✅ Verified Leads: {analytics['verified_leads']}")
     print(f"📈 Conversion Rate: {analytics['conversion_rate']}")
     
+    outbox = get_outbox_stats()
+    print(f"📬 CRM Delivery: {outbox['sent']} sent, {outbox['pending'] + outbox['sending']} pending, {outbox['failed']} failed")
+    
     print("\n🏆 Top Project Interests:")
     for project, count in analytics['top_projects']:
         print(f"   • {project}: {count} leads")
 
+def display_activity(period="day", limit=14):
+    """Display per-hour or per-day activity"""
+    print_header(f"📅 ACTIVITY BY {period.upper()} (Last {limit})")
+    
+    for row in get_activity_rollups(period, limit):
+        print(f"   {row['bucket']}: 💬 {row['messages']} messages, 👥 {row['new_sessions']} new visitors, 📞 {row['new_leads']} new leads")
+
+def _format_duration(seconds):
+    if seconds == float("inf"):
+        return "∞"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds/60:.1f}m"
+    return f"{seconds/3600:.1f}h"
+
+def display_funnel():
+    """Display the stage funnel, drop-offs and per-project conversion"""
+    print_header("🔻 CONVERSION FUNNEL")
+    
+    report = get_funnel_report()
+    print(f"\n💬 {report['turns']} turns across {report['sessions']} sessions")
+    
+    print("\n📉 Funnel:")
+    for step in report['funnel']:
+        print(f"   {step['stage']:<24} {step['sessions']:>7}  ({step['conversion']*100:5.1f}% of start, -{step['drop_off']*100:.1f}% from previous)")
+    
+    if report['exit_stages']:
+        print("\n🚪 Where unverified visitors stopped:")
+        for stage, count in report['exit_stages']:
+            print(f"   • {stage}: {count}")
+    
+    ttv = report['time_to_verification']
+    if ttv['verified_sessions']:
+        print(f"\n⏱️ Time to Verification ({ttv['verified_sessions']} sessions):")
+        print(f"   median {_format_duration(ttv['p50'])}, p90 {_format_duration(ttv['p90'])}, p99 {_format_duration(ttv['p99'])}, max {_format_duration(ttv['max'])}")
+        for lo, hi, count in ttv['histogram']:
+            if count:
+                print(f"   {_format_duration(lo)}–{_format_duration(hi)}: {count}")
+    
+    if report['transitions']:
+        print("\n🔀 Top Stage Transitions:")
+        for src, dst, count in report['transitions']:
+            print(f"   {src} → {dst}: {count}")
+    
+    if report['projects']:
+        print("\n🏡 Conversion by Project:")
+        for p in report['projects']:
+            print(f"   • {p['project']}: {p['sessions']} sessions, {p['phone_collected']} phones, {p['verified']} verified ({p['conversion']*100:.1f}%)")
+
 def display_recent_conversations(limit=10):
     """Display recent conversations"""
     print_header(f"📝 RECENT CONVERSATIONS (Last {limit})")
     
-    logs = load_logs()
-    recent = logs[-limit:][::-1]  # Get last N and reverse
+    recent = get_recent_logs(limit)  # Newest first
     
     for i, log in enumerate(recent, 1):
         print(f"\n{i}. Session: {log['session_id'][:8]}...")
@@ -50,12 +109,31 @@ def display_recent_conversations(limit=10):
         if lead.get('interested_project_name'):
             print(f"   🏡 Interest: {lead['interested_project_name']}")
 
+def display_search_results(query, limit=20):
+    """Display sessions matching a full-text search, most recent first"""
+    print_header(f"🔎 SEARCH: {query}")
+    
+    results = search_sessions(query, limit)
+    
+    if not results:
+        print("❌ No matching conversations found!")
+        return
+    
+    for i, r in enumerate(results, 1):
+        print(f"\n{i}. Session: {r['session_id']}")
+        print(f"   Latest match: {r['formatted_time']} ({r['hits']} matching turns)")
+        print(f"   User: {(r['user_message'] or '')[:80]}")
+        lead = r['lead_data']
+        if lead.get('name'):
+            print(f"   👤 Name: {lead['name']}")
+        if lead.get('phone'):
+            print(f"   📞 Phone: {lead['phone']}")
+
 def display_session_details(session_id):
     """Display full conversation for a session"""
     print_header(f"🔍 SESSION DETAILS: {session_id}")
     
-    logs = load_logs()
-    session_logs = [l for l in logs if l['session_id'] == session_id]
+    session_logs = get_session_logs(session_id)
     
     if not session_logs:
         print("❌ Session not found!")
@@ -85,10 +163,14 @@ def main_menu():
         print("2. View Recent Conversations")
         print("3. View All Sessions")
         print("4. View Session Details")
-        print("5. Export Logs to CSV")
-        print("6. Exit")
+        print("5. Search Conversations")
+        print("6. View Activity by Hour/Day")
+        print("7. View Conversion Funnel")
+        print("8. Export Logs to CSV")
+        print("9. Rebuild Analytics From Logs")
+        print("10. Exit")
         
-        choice = input("\nEnter your choice (1-6): ").strip()
+        choice = input("\nEnter your choice (1-10): ").strip()
         
         if choice == '1':
             display_analytics()
@@ -114,9 +196,24 @@ def main_menu():
             session_id = input("Enter session ID: ").strip()
             display_session_details(session_id)
         elif choice == '5':
+            query = input("Search for (e.g. possession sector 49): ").strip()
+            if query:
+                display_search_results(query)
+        elif choice == '6':
+            period = input("Group by (hour/day, default day): ").strip().lower() or "day"
+            if period == "hour":
+                display_activity("hour", 24)
+            else:
+                display_activity("day", 14)
+        elif choice == '7':
+            display_funnel()
+        elif choice == '8':
             filename = export_logs_csv()
             print(f"\n✅ Logs exported to: {filename}")
-        elif choice == '6':
+        elif choice == '9':
+            count = rebuild_analytics()
+            print(f"\n✅ Analytics rebuilt from {count} log entries")
+        elif choice == '10':
             print("\n👋 Goodbye!")
             break
         else:
@@ -125,4 +222,7 @@ def main_menu():
         input("\nPress Enter to continue...")
 
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    if sys.argv[1:] == ["rebuild"]:
+        rebuild_analytics()
+    else:
+        main_menu()
\ No newline at end of file
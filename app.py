@@ -1,23 +1,57 @@
+import hmac
+import math
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from agent_logic import run_conversation
+from agent_logic import run_conversation, run_conversation_stream
+from block_stream import format_sse
+from log_export import EXPORT_FORMATS, export_filename, iter_export
+from rate_limit import BUSY_RESPONSE, RATE_LIMITED_RESPONSE, AdmissionController, check_chat_rate, client_ip
+from session_store import new_session_id
 import json
 
 app = Flask(__name__)
 CORS(app)  # Allow Next.js app to communicate
 
+# Log exports contain customer phone numbers; the endpoint is off unless a token is set
+LOG_EXPORT_TOKEN = os.environ.get("LOG_EXPORT_TOKEN")
+
+admission = AdmissionController()
+
+def _rate_limited(session_id):
+    """429 with Retry-After if this client or session is over its chat rate, else None"""
+    ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+    retry_after = check_chat_rate(ip, session_id)
+    if not retry_after:
+        return None
+    return jsonify({**RATE_LIMITED_RESPONSE, "session_id": session_id}), 429, {"Retry-After": str(math.ceil(retry_after))}
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     user_message = data.get("message")
     
+    # Each visitor keeps their own conversation; the client echoes the id back
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or new_session_id()
+    
+    limited = _rate_limited(session_id)
+    if limited:
+        return limited
+    
+    # Answer fast with a "please retry" rather than queueing behind every other chat
+    if not admission.acquire():
+        return jsonify({**BUSY_RESPONSE, "session_id": session_id}), 503
+    
     # Get response from agent
-    response = run_conversation(user_message)
+    try:
+        response = run_conversation(user_message, session_id=session_id)
+    finally:
+        admission.release()
     
     # Parse the JSON string response
     try:
         response_json = json.loads(response)
+        response_json["session_id"] = session_id
         # Return as JSON object, not string
         return jsonify(response_json)
     except json.JSONDecodeError as e:
@@ -30,9 +64,67 @@ def chat():
                 "props": {
                     "text": "I'm having trouble processing your request. Please try again or call **+91 92500-94500**."
                 }
-            }]
+            }],
+            "session_id": session_id
         })
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat, but sends each reply block as an SSE event as soon as it is ready"""
+    data = request.json
+    user_message = data.get("message")
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or new_session_id()
+    
+    limited = _rate_limited(session_id)
+    if limited:
+        return limited
+    if not admission.acquire():
+        return jsonify({**BUSY_RESPONSE, "session_id": session_id}), 503
+    
+    def generate():
+        yield format_sse("session", {"session_id": session_id})
+        for block in run_conversation_stream(user_message, session_id=session_id):
+            yield format_sse("block", block)
+        yield format_sse("done", {"session_id": session_id})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # The WSGI server closes every response exactly once, even one it never
+    # iterated because the client left early, so the slot is released there
+    response.call_on_close(admission.release)
+    return response
+
+@app.route('/logs/export', methods=['GET'])
+def export_logs():
+    """Stream a log export: ?format=csv|columnar&start=&end=&session_id=&gzip=1"""
+    if not LOG_EXPORT_TOKEN:
+        return jsonify({"error": "Log export is disabled"}), 404
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token, LOG_EXPORT_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    compress = request.args.get("gzip") in ("1", "true")
+    
+    chunks = iter_export(
+        fmt,
+        start=request.args.get("start"),
+        end=request.args.get("end"),
+        session_id=request.args.get("session_id"),
+        compress=compress
+    )
+    headers = {"Content-Disposition": f"attachment; filename={export_filename(fmt, compress)}"}
+    if compress:
+        mimetype = "application/gzip"
+    else:
+        mimetype = EXPORT_FORMATS[fmt][0]
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 if __name__ == "__main__":
     # Render sets the PORT environment variable automatically
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,112 @@
+# app_async.py
+"""
+ASGI version of app.py for high-concurrency deployments.
+
+Chats spend nearly all their time waiting on the model, so one event loop
+can serve many of them at once. Run with:
+    uvicorn app_async:app --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import json
+import math
+import os
+
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+
+from agent_logic import run_conversation_async, run_conversation_stream_async
+from block_stream import format_sse
+from rate_limit import (
+    BUSY_RESPONSE, RATE_LIMITED_RESPONSE, AsyncAdmissionController, check_chat_rate, client_ip
+)
+from session_store import new_session_id
+
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # Allow Next.js app to communicate
+
+admission = AsyncAdmissionController()
+
+
+async def _rate_limited(session_id):
+    """429 with Retry-After if this client or session is over its chat rate, else None"""
+    ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+    # The bucket store may be Redis; don't block the event loop on it
+    retry_after = await asyncio.to_thread(check_chat_rate, ip, session_id)
+    if not retry_after:
+        return None
+    return jsonify({**RATE_LIMITED_RESPONSE, "session_id": session_id}), 429, {"Retry-After": str(math.ceil(retry_after))}
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_message = data.get("message")
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or new_session_id()
+
+    limited = await _rate_limited(session_id)
+    if limited:
+        return limited
+
+    if not await admission.acquire():
+        return jsonify({**BUSY_RESPONSE, "session_id": session_id}), 503
+
+    try:
+        response = await run_conversation_async(user_message, session_id=session_id)
+    finally:
+        admission.release()
+
+    try:
+        response_json = json.loads(response)
+        response_json["session_id"] = session_id
+        return jsonify(response_json)
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON Parse Error: {e}")
+        print(f"Response was: {response}")
+        return jsonify({
+            "blocks": [{
+                "component": "Text",
+                "props": {
+                    "text": "I'm having trouble processing your request. Please try again or call **+91 92500-94500**."
+                }
+            }],
+            "session_id": session_id
+        })
+
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Same as /chat, but sends each reply block as an SSE event as soon as it is ready"""
+    data = await request.get_json()
+    user_message = data.get("message")
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or new_session_id()
+
+    limited = await _rate_limited(session_id)
+    if limited:
+        return limited
+
+    # The slot is taken inside the generator: Quart has no close hook, and a
+    # generator the client never lets start would never reach its finally
+    async def generate():
+        yield format_sse("session", {"session_id": session_id})
+        if not await admission.acquire():
+            for block in BUSY_RESPONSE["blocks"]:
+                yield format_sse("block", block)
+            yield format_sse("done", {"session_id": session_id})
+            return
+        try:
+            async for block in run_conversation_stream_async(user_message, session_id=session_id):
+                yield format_sse("block", block)
+            yield format_sse("done", {"session_id": session_id})
+        finally:
+            admission.release()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None
+    return response
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host="0.0.0.0", port=port)
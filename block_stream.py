@@ -0,0 +1,100 @@
+# block_stream.py
+"""
+Incremental parser for streamed model replies of the form {"blocks": [...]}.
+
+Feed it text deltas as they arrive; it returns every block of the "blocks"
+array as soon as that block's closing brace has been received, so the UI can
+render the first Text block while the rest of the reply is still generating.
+"""
+import json
+
+
+class BlockStreamParser:
+    def __init__(self):
+        # Chunks are kept as received and joined only when .text is read;
+        # appending to one string would copy the whole reply on every token
+        self._chunks = []
+        self._stack = []           # open containers: "{" or "["
+        self._in_string = False
+        self._escape = False
+        self._key_parts = None     # pieces of the top-level string being read
+        self._last_string = None   # last complete top-level string, i.e. the key before a ':'
+        self._blocks_depth = None  # stack depth of the "blocks" array once entered
+        self._block_parts = None   # pieces of the block being read
+        self.emitted = 0
+
+    @property
+    def text(self):
+        """The whole reply received so far"""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk):
+        """Add a chunk of the reply; returns the blocks completed by it"""
+        chunk = chunk or ""
+        self._chunks.append(chunk)
+        completed = []
+        # Where the open key / block continues in this chunk
+        key_from = block_from = 0
+
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._key_parts.append(chunk[key_from:i])
+                        self._last_string = "".join(self._key_parts)
+                        self._key_parts = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                # Only a top-level key can be "blocks"; deeper strings aren't kept
+                if len(self._stack) == 1:
+                    self._key_parts = []
+                    key_from = i + 1
+            elif ch in "{[":
+                if ch == "[" and self._blocks_depth is None and self._stack == ["{"] and self._last_string == "blocks":
+                    self._blocks_depth = len(self._stack) + 1
+                elif ch == "{" and self._blocks_depth is not None and len(self._stack) == self._blocks_depth:
+                    self._block_parts = []
+                    block_from = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if ch == "}" and self._block_parts is not None and len(self._stack) == self._blocks_depth:
+                    self._block_parts.append(chunk[block_from:i + 1])
+                    block = self._parse_block("".join(self._block_parts))
+                    self._block_parts = None
+                    if block is not None:
+                        completed.append(block)
+                elif ch == "]" and self._blocks_depth is not None and len(self._stack) == self._blocks_depth - 1:
+                    self._blocks_depth = -1  # array closed; ignore anything after it
+
+        if self._key_parts is not None:
+            self._key_parts.append(chunk[key_from:])
+        if self._block_parts is not None:
+            self._block_parts.append(chunk[block_from:])
+
+        self.emitted += len(completed)
+        return completed
+
+    @staticmethod
+    def _parse_block(raw):
+        try:
+            block = json.loads(raw)
+        except ValueError:
+            return None
+        return block if isinstance(block, dict) else None
+
+
+def format_sse(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
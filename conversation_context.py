@@ -0,0 +1,93 @@
+# conversation_context.py
+"""
+Keeps the history sent to the model bounded.
+
+The last HISTORY_KEEP_TURNS turns are kept verbatim as long as they fit in
+HISTORY_TOKEN_BUDGET. Older turns are dropped from the session and replaced
+by a short summary built from the lead data, which already holds everything
+the flow needs from them (name, phone, project, requirements).
+"""
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "6"))
+
+# Rough per-message overhead of the chat format, in tokens
+_MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text):
+    """Tokenizer-free estimate (~4 characters per token for English/JSON)"""
+    return len(text or "") // 4 + 1
+
+
+def _message_tokens(message):
+    return estimate_tokens(message.get("content")) + _MESSAGE_OVERHEAD
+
+
+def split_turns(history):
+    """Group history into turns, each starting at a user message"""
+    turns = []
+    for message in history:
+        if message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def trim_history(session, token_budget=None, keep_turns=None):
+    """Fold the oldest turns out of session.history; returns how many were folded"""
+    token_budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    keep_turns = HISTORY_KEEP_TURNS if keep_turns is None else keep_turns
+
+    turns = split_turns(session.history)
+    tokens = sum(_message_tokens(m) for turn in turns for m in turn)
+
+    folded = 0
+    # Always keep the latest turn, even if it alone is over budget
+    while len(turns) > 1 and (len(turns) > keep_turns or tokens > token_budget):
+        tokens -= sum(_message_tokens(m) for m in turns[0])
+        turns.pop(0)
+        folded += 1
+
+    if folded:
+        session.history[:] = [m for turn in turns for m in turn]
+        session.folded_turns += folded
+        print(f"🗜️ Folded {folded} old turn(s) into the summary ({session.folded_turns} total)")
+    return folded
+
+
+def build_summary(session):
+    """Structured summary standing in for the folded turns, or None"""
+    if not session.folded_turns:
+        return None
+
+    lead = session.lead
+    lines = [f"EARLIER CONVERSATION SUMMARY ({session.folded_turns} earlier turns omitted)"]
+    if lead.get("customer_type"):
+        lines.append(f"- Customer type: {lead['customer_type']}")
+    if lead.get("name"):
+        lines.append(f"- Name: {lead['name']}")
+    if lead.get("phone"):
+        lines.append(f"- Phone: {lead['phone']} ({'verified' if lead.get('phone_verified') else 'not verified'})")
+    if lead.get("interested_project_name"):
+        lines.append(f"- Interested project: {lead['interested_project_name']}")
+    requirements = {k: v for k, v in (lead.get("requirements") or {}).items() if v}
+    if requirements:
+        lines.append("- Requirements: " + "; ".join(f"{k}: {v}" for k, v in requirements.items()))
+    if lead.get("lead_submitted"):
+        lines.append("- Lead already submitted to the sales team")
+    lines.append("Do not ask again for anything listed above.")
+    return "\n".join(lines)
+
+
+def build_messages(session, static_prompt, lead_status_prompt):
+    """Messages for the model: static prefix, summary, recent turns, lead status"""
+    messages = [{"role": "system", "content": static_prompt}]
+    summary = build_summary(session)
+    if summary:
+        messages.append({"role": "system", "content": summary})
+    messages.extend(session.history)
+    messages.append({"role": "system", "content": lead_status_prompt})
+    return messages
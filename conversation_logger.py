@@ -1,27 +1,159 @@
 # conversation_logger.py
-import json
 from datetime import datetime
+import atexit
 import os
+import queue
+import threading
+import time
 
-# File to store conversation logs
-LOG_FILE = "conversation_logs.json"
+from log_store import get_log_store
+
+def append_log_entries(entries, sync=False):
+    """Write entries to the configured log store"""
+    get_log_store().append(entries, sync=sync)
+
+def append_log_entry(entry):
+    """Write one entry to the configured log store"""
+    append_log_entries([entry])
+
+# =========================
+# BACKGROUND WRITER
+# =========================
+# Log writes happen off the request path: entries go into a bounded queue and
+# a writer thread appends them in groups, with one fsync per group.
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "100"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "0.5"))
+# How long a request may wait for queue space before its entry is dropped
+LOG_ENQUEUE_TIMEOUT = float(os.environ.get("LOG_ENQUEUE_TIMEOUT", "0.05"))
+
+_STOP = object()
+
+
+class LogWriter(threading.Thread):
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "backpressured": 0,  # had to wait for queue space
+            "dropped": 0,        # queue still full after waiting
+            "write_errors": 0,
+        }
+        self._metrics_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._metrics_lock:
+            self.metrics[key] += n
+
+    def submit(self, entry):
+        """Queue an entry; returns False if it had to be dropped"""
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self._count("backpressured")
+            try:
+                self.queue.put(entry, timeout=LOG_ENQUEUE_TIMEOUT)
+            except queue.Full:
+                self._count("dropped")
+                print("⚠️ Log queue full, dropping entry")
+                return False
+        self._count("enqueued")
+        return True
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # Group commit: keep collecting until the batch is full or the interval ends
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            append_log_entries(batch, sync=True)
+        except Exception as e:
+            self._count("write_errors")
+            print(f"❌ Failed to write {len(batch)} log entries: {e}")
+            return
+        self._count("written", len(batch))
+        self._count("batches")
+        print(f"✅ Logged {len(batch)} conversation turn(s)")
+
+    def drain(self, timeout=5.0):
+        """Flush everything queued so far and stop the thread"""
+        if not self.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ Log queue full at shutdown, some entries may be lost")
+            return
+        self.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_log_writer():
+    """Process-wide background writer, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = LogWriter()
+            _writer.start()
+            atexit.register(_writer.drain)
+        return _writer
+
+def drain_log_writer(timeout=5.0):
+    """Shutdown hook: write out all queued entries"""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.drain(timeout)
+
+def get_log_metrics():
+    """Counters of the background writer (plus current queue depth)"""
+    with _writer_lock:
+        writer = _writer
+    if writer is None:
+        return {"queued": 0}
+    with writer._metrics_lock:
+        return {**writer.metrics, "queued": writer.queue.qsize()}
+
+def iter_logs():
+    """Yield log entries in write order without loading them all"""
+    return get_log_store().iter_entries()
 
 def load_logs():
     """Load existing conversation logs"""
-    if os.path.exists(LOG_FILE):
-        try:
-            with open(LOG_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
-def save_logs(logs):
-    """Save conversation logs to file"""
-    with open(LOG_FILE, 'w') as f:
-        json.dump(logs, f, indent=2)
-
-def log_conversation(session_id, user_message, ai_response, lead_data=None):
+    return list(iter_logs())
+
+def get_recent_logs(limit=10):
+    """Last `limit` log entries, newest first"""
+    return get_log_store().recent(limit)
+
+def log_conversation(session_id, user_message, ai_response, lead_data=None, stage=None):
     """
     Log a conversation turn with timestamp
     
@@ -30,9 +162,8 @@ def log_conversation(session_id, user_message, ai_response, lead_data=None):
         user_message: The message from the user
         ai_response: The AI's response
         lead_data: Current lead information (optional)
+        stage: Conversation stage after this turn (optional)
     """
-    logs = load_logs()
-    
     timestamp = datetime.now().isoformat()
     
     log_entry = {
@@ -41,105 +172,63 @@ def log_conversation(session_id, user_message, ai_response, lead_data=None):
         "formatted_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "user_message": user_message,
         "ai_response": ai_response,
-        "lead_data": lead_data or {}
+        "lead_data": lead_data or {},
+        "stage": stage
     }
     
-    logs.append(log_entry)
-    save_logs(logs)
-    
-    print(f"✅ Logged conversation at {timestamp}")
+    if LOG_ASYNC:
+        get_log_writer().submit(log_entry)
+    else:
+        append_log_entry(log_entry)
+        print(f"✅ Logged conversation at {timestamp}")
     
     return log_entry
 
 def get_session_logs(session_id):
     """Get all logs for a specific session"""
-    logs = load_logs()
-    return [log for log in logs if log.get("session_id") == session_id]
+    return get_log_store().session_entries(session_id)
 
 def get_all_sessions():
     """Get summary of all chat sessions"""
-    logs = load_logs()
-    sessions = {}
-    
-    for log in logs:
-        sid = log.get("session_id")
-        if sid not in sessions:
-            sessions[sid] = {
-                "session_id": sid,
-                "first_message": log.get("timestamp"),
-                "last_message": log.get("timestamp"),
-                "message_count": 0,
-                "lead_info": {}
-            }
-        
-        sessions[sid]["message_count"] += 1
-        sessions[sid]["last_message"] = log.get("timestamp")
-        
-        # Update lead info if available
-        if log.get("lead_data"):
-            sessions[sid]["lead_info"] = log.get("lead_data")
-    
-    return list(sessions.values())
+    return get_log_store().sessions()
 
-def export_logs_csv():
-    """Export logs to CSV format"""
-    import csv
-    
-    logs = load_logs()
+def search_sessions(query, limit=20):
+    """Sessions whose messages or replies contain every word of query, most recent first"""
+    return get_log_store().search(query, limit)
+
+def export_logs_csv(start=None, end=None, session_id=None, compress=False):
+    """Export logs to CSV format, streaming from the log store"""
+    from log_export import export_logs
     
-    if not logs:
+    if not get_log_store().count():
         return "No logs to export"
     
-    csv_file = f"conversation_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'session_id', 'timestamp', 'user_message', 'ai_response', 
-            'name', 'phone', 'project_interest'
-        ])
-        writer.writeheader()
-        
-        for log in logs:
-            writer.writerow({
-                'session_id': log.get('session_id'),
-                'timestamp': log.get('formatted_time'),
-                'user_message': log.get('user_message'),
-                'ai_response': str(log.get('ai_response'))[:200],  # Truncate long responses
-                'name': log.get('lead_data', {}).get('name', ''),
-                'phone': log.get('lead_data', {}).get('phone', ''),
-                'project_interest': log.get('lead_data', {}).get('interested_project_name', '')
-            })
-    
-    print(f"✅ Exported logs to {csv_file}")
-    return csv_file
+    return export_logs(fmt="csv", start=start, end=end, session_id=session_id, compress=compress)
 
 # Analytics functions
 def get_analytics():
-    """Get conversation analytics"""
-    logs = load_logs()
-    sessions = get_all_sessions()
-    
-    total_visitors = len(sessions)
-    total_messages = len(logs)
-    
-    # Count leads with phone numbers
-    leads_captured = sum(1 for s in sessions if s.get('lead_info', {}).get('phone'))
+    """Get conversation analytics (precomputed counters, no log scan)"""
+    analytics = get_log_store().analytics(top_n=5)
     
-    # Count verified leads
-    verified_leads = sum(1 for s in sessions if s.get('lead_info', {}).get('phone_verified'))
-    
-    # Most interested projects
-    project_interests = {}
-    for s in sessions:
-        project = s.get('lead_info', {}).get('interested_project_name')
-        if project:
-            project_interests[project] = project_interests.get(project, 0) + 1
+    total_visitors = analytics["total_visitors"]
+    leads_captured = analytics["leads_captured"]
     
     return {
         "total_visitors": total_visitors,
-        "total_messages": total_messages,
+        "total_messages": analytics["total_messages"],
         "leads_captured": leads_captured,
-        "verified_leads": verified_leads,
+        "verified_leads": analytics["verified_leads"],
         "conversion_rate": f"{(leads_captured/total_visitors*100):.1f}%" if total_visitors > 0 else "0%",
-        "top_projects": sorted(project_interests.items(), key=lambda x: x[1], reverse=True)[:5]
-    }
\ No newline at end of file
+        "top_projects": [tuple(p) for p in analytics["top_projects"]]
+    }
+
+def get_activity_rollups(period="day", limit=24):
+    """Messages, new sessions and new leads per hour or day, newest first"""
+    return get_log_store().rollups(period, limit)
+
+def rebuild_analytics():
+    """Recompute the analytics aggregates and search index from the raw logs"""
+    drain_log_writer()
+    store = get_log_store()
+    store.rebuild_search_index()
+    return store.rebuild_aggregates()
@@ -0,0 +1,262 @@
+# crm_outbox.py
+"""
+Durable outbox for CRM lead submissions.
+
+check_and_submit_lead writes the lead into a SQLite outbox and returns; a
+background worker delivers it to the CRM. Leads survive restarts and CRM
+outages:
+- each lead has an idempotency key (session + phone), so the same lead is
+  queued once and the CRM gets the same key on every retry
+- failed deliveries are retried with exponential backoff and jitter, up to
+  CRM_MAX_ATTEMPTS, then parked as "failed" for a manual look
+- the worker claims due leads in batches inside a write transaction, so
+  several app processes can share one outbox without double-sending
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from tools import add_lead_to_crm
+
+CRM_OUTBOX_DB = os.environ.get("CRM_OUTBOX_DB", "crm_outbox.db")
+CRM_MAX_ATTEMPTS = int(os.environ.get("CRM_MAX_ATTEMPTS", "10"))
+CRM_BACKOFF_BASE = float(os.environ.get("CRM_BACKOFF_BASE", "5"))
+CRM_BACKOFF_MAX = float(os.environ.get("CRM_BACKOFF_MAX", "1800"))
+CRM_BATCH_SIZE = int(os.environ.get("CRM_BATCH_SIZE", "20"))
+CRM_POLL_INTERVAL = float(os.environ.get("CRM_POLL_INTERVAL", "5"))
+# A claimed lead whose worker died is retried after this long
+CRM_CLAIM_TIMEOUT = float(os.environ.get("CRM_CLAIM_TIMEOUT", "120"))
+
+# CRM answers that will not improve on retry (anything else 4xx except these)
+RETRYABLE_4XX = {408, 409, 425, 429}
+
+
+def idempotency_key(session_id, phone):
+    """Stable key for one visitor's lead"""
+    return hashlib.sha1(f"{session_id or ''}:{phone}".encode("utf-8")).hexdigest()
+
+
+def backoff_delay(attempts):
+    """Seconds before retry number `attempts`: exponential, jittered to 50-100%"""
+    delay = min(CRM_BACKOFF_BASE * (2 ** (attempts - 1)), CRM_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+class LeadOutbox:
+    def __init__(self, path=CRM_OUTBOX_DB):
+        self.path = path
+        self._local = threading.local()
+        self._inherited = []  # connections opened before a fork, never used or closed again
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',   -- pending | sending | sent | failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+            """
+        )
+        conn.commit()
+
+    def _conn(self):
+        # Per thread and per process: after a gunicorn fork the child's
+        # thread-local still holds the parent's connection, which SQLite
+        # must not use across a fork (same pid check as http_client)
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != pid:
+            if conn is not None:
+                # Keep it referenced: closing it here could touch the parent's WAL
+                self._inherited.append(conn)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def enqueue(self, key, payload):
+        """Queue a lead; False if a lead with this key is already queued or sent"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                """INSERT OR IGNORE INTO outbox (idempotency_key, payload, next_attempt_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (key, json.dumps(payload, ensure_ascii=False), now, now, now)
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, limit=CRM_BATCH_SIZE):
+        """Mark up to `limit` due leads as sending and return them as (id, key, payload, attempts)"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """SELECT id, idempotency_key, payload, attempts FROM outbox
+                   WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT ?""",
+                (now, limit)
+            ).fetchall()
+            # 'sending' rows are only due again once their claim has timed out
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                [(now + CRM_CLAIM_TIMEOUT, now, row[0]) for row in rows]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [(row_id, key, json.loads(payload), attempts) for row_id, key, payload, attempts in rows]
+
+    def mark_sent(self, row_id):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE id = ?",
+                (now, row_id)
+            )
+
+    def mark_failed(self, row_id, attempts, error, permanent=False):
+        """Record a failed delivery; schedules a retry unless out of attempts"""
+        now = time.time()
+        attempts += 1
+        give_up = permanent or attempts >= CRM_MAX_ATTEMPTS
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                   WHERE id = ?""",
+                ("failed" if give_up else "pending", attempts, now + backoff_delay(attempts), str(error)[:500], now, row_id)
+            )
+        return not give_up
+
+    def next_due_in(self):
+        """Seconds until the next pending lead is due, or None if there is none"""
+        row = self._conn().execute(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def stats(self):
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "sending", "sent", "failed")}
+
+    def retry_failed(self):
+        """Put parked leads back in the queue; returns how many"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? WHERE status = 'failed'",
+                (now, now)
+            )
+        return cursor.rowcount
+
+
+def deliver(payload, key):
+    """Send one lead to the CRM; returns (ok, error, permanent)"""
+    result = add_lead_to_crm(idempotency_key=key, **payload)
+    if result.get("status") == "success":
+        return True, None, False
+    code = result.get("response_code")
+    permanent = code is not None and 400 <= code < 500 and code not in RETRYABLE_4XX
+    return False, result.get("message"), permanent
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self, outbox, batch_size=CRM_BATCH_SIZE, poll_interval=CRM_POLL_INTERVAL):
+        super().__init__(name="crm-outbox", daemon=True)
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+
+    def notify(self):
+        """Wake the worker for a newly queued lead"""
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                delivered = self.drain_once()
+                wait = self.outbox.next_due_in()
+            except Exception as e:
+                print(f"❌ CRM outbox error: {e}")
+                delivered, wait = 0, None
+            if delivered >= self.batch_size:
+                continue  # more may be due right away
+            wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def drain_once(self):
+        """Deliver one batch of due leads; returns how many were attempted"""
+        batch = self.outbox.claim(self.batch_size)
+        for row_id, key, payload, attempts in batch:
+            try:
+                ok, error, permanent = deliver(payload, key)
+            except Exception as e:
+                ok, error, permanent = False, e, False
+            if ok:
+                self.outbox.mark_sent(row_id)
+                print(f"📬 Lead {key[:8]} delivered to CRM")
+            elif self.outbox.mark_failed(row_id, attempts, error, permanent):
+                print(f"🔁 Lead {key[:8]} delivery failed ({error}), will retry")
+            else:
+                print(f"🛑 Lead {key[:8]} delivery failed ({error}), giving up after {attempts + 1} attempt(s)")
+        return len(batch)
+
+
+_outbox = None
+_worker = None
+_outbox_lock = threading.Lock()
+
+
+def get_lead_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = LeadOutbox()
+        return _outbox
+
+
+def start_outbox_worker():
+    """Start the delivery worker (idempotent; restarts it after a fork)"""
+    global _worker
+    outbox = get_lead_outbox()
+    with _outbox_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker(outbox)
+            _worker.start()
+        return _worker
+
+
+def enqueue_lead(session_id, name, phone, project_id, remarks):
+    """Queue a lead for CRM delivery; returns its idempotency key"""
+    key = idempotency_key(session_id, phone)
+    payload = {"name": name, "phone": phone, "project_id": project_id, "remarks": remarks}
+    if get_lead_outbox().enqueue(key, payload):
+        print(f"📥 Lead {key[:8]} queued for CRM delivery")
+    else:
+        print(f"ℹ️ Lead {key[:8]} was already queued")
+    start_outbox_worker().notify()
+    return key
+
+
+def get_outbox_stats():
+    return get_lead_outbox().stats()
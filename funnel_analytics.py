@@ -0,0 +1,213 @@
+# funnel_analytics.py
+"""
+Funnel and stage-transition analytics over the per-turn stage log.
+
+Turns are loaded once into NumPy columns (session, time, stage, project),
+sorted by session and time; every metric is then a few vectorized passes:
+- funnel: sessions reaching each step of FUNNEL_STAGES and the drop-off between steps
+- exit stages: the last stage of sessions that never verified
+- time to verification: first turn to first VERIFIED turn, per session
+- transitions: stage -> stage moves between consecutive turns of a session
+- project conversion: phone collected / verified sessions per interested project
+
+Turns logged before the stage was recorded have no stage; they still count
+for the project columns but not for the funnel.
+"""
+import numpy as np
+
+from log_store import get_log_store
+
+FUNNEL_STAGES = ["INITIAL", "CUSTOMER_TYPE_SELECTED", "NAME_COLLECTED", "PHONE_COLLECTED", "OTP_SENT", "VERIFIED"]
+
+# Side stages count as the furthest funnel step they imply
+STAGE_RANK = {
+    **{stage: rank for rank, stage in enumerate(FUNNEL_STAGES)},
+    "PHONE_INVALID": 2,
+    "OTP_INVALID": 4,
+}
+PHONE_RANK = FUNNEL_STAGES.index("PHONE_COLLECTED")
+VERIFIED_RANK = FUNNEL_STAGES.index("VERIFIED")
+
+# Time-to-verification histogram edges, in seconds
+TTV_BINS = [0, 60, 120, 300, 600, 1800, 3600, 86400, np.inf]
+
+
+def _strings(values, missing=""):
+    """Column of str from a tuple that may contain None"""
+    column = np.array(values, dtype=object)
+    column[column == None] = missing  # noqa: E711 (elementwise comparison)
+    return column.astype(str)
+
+
+class TurnColumns:
+    """Logged turns as parallel arrays, sorted by session then time"""
+
+    def __init__(self, session_ids, timestamps, stages, projects):
+        self.session_names, sessions = np.unique(session_ids, return_inverse=True)
+        self.stage_names, stage_codes = np.unique(stages, return_inverse=True)
+        self.project_names, project_codes = np.unique(projects, return_inverse=True)
+        times = timestamps.astype("datetime64[us]").astype(np.int64)
+
+        # Stable: turns with equal timestamps keep their write order
+        order = np.lexsort((times, sessions))
+        self.sessions = sessions[order]
+        self.times = times[order]
+        self.stages = stage_codes[order]
+
+        rank_table = np.array([STAGE_RANK.get(name, -1) for name in self.stage_names], dtype=np.int8)
+        self.ranks = rank_table[self.stages] if len(rank_table) else np.empty(0, dtype=np.int8)
+
+        # "" means no project; mark it as -1
+        project_codes = project_codes[order]
+        empty = np.flatnonzero(self.project_names == "")
+        if len(empty):
+            project_codes = np.where(project_codes == empty[0], -1, project_codes)
+        self.projects = project_codes
+
+        # First turn of every session (every session code occurs at least once)
+        self.starts = np.flatnonzero(np.r_[True, self.sessions[1:] != self.sessions[:-1]]) if len(self.sessions) else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @property
+    def n_sessions(self):
+        return len(self.session_names)
+
+    def max_rank(self):
+        """Furthest funnel step per session (-1 if no stage was logged)"""
+        if not len(self):
+            return np.empty(0, dtype=np.int8)
+        return np.maximum.reduceat(self.ranks, self.starts)
+
+
+def load_turns(start=None, end=None, store=None):
+    """Read turns from the log store into TurnColumns, chunk by chunk"""
+    store = store or get_log_store()
+    session_ids, timestamps, stages, projects = [], [], [], []
+    for rows in store.iter_funnel_rows(start=start, end=end):
+        sid, ts, stage, project = zip(*rows)
+        session_ids.append(_strings(sid))
+        timestamps.append(_strings(ts, missing="NaT").astype("datetime64[us]"))
+        stages.append(_strings(stage))
+        projects.append(_strings(project))
+
+    if not session_ids:
+        empty = np.empty(0, dtype=str)
+        return TurnColumns(empty, np.empty(0, dtype="datetime64[us]"), empty, empty)
+    return TurnColumns(
+        np.concatenate(session_ids),
+        np.concatenate(timestamps),
+        np.concatenate(stages),
+        np.concatenate(projects)
+    )
+
+
+def funnel(turns):
+    """Sessions reaching each funnel step, with conversion from the start and step drop-off"""
+    max_rank = turns.max_rank()
+    tracked = max_rank[max_rank >= 0]
+    counts = np.bincount(tracked, minlength=len(FUNNEL_STAGES))
+    reached = counts[::-1].cumsum()[::-1]
+
+    steps = []
+    for i, stage in enumerate(FUNNEL_STAGES):
+        previous = reached[i - 1] if i else reached[0]
+        steps.append({
+            "stage": stage,
+            "sessions": int(reached[i]),
+            "conversion": float(reached[i] / reached[0]) if reached[0] else 0.0,
+            "drop_off": float(1 - reached[i] / previous) if previous else 0.0,
+        })
+    return steps
+
+
+def exit_stages(turns):
+    """Last logged stage of sessions that never verified, most common first"""
+    if not len(turns):
+        return []
+    ends = np.r_[turns.starts[1:], len(turns)] - 1
+    max_rank = turns.max_rank()
+    dropped = (max_rank >= 0) & (max_rank < VERIFIED_RANK)
+    counts = np.bincount(turns.stages[ends[dropped]], minlength=len(turns.stage_names))
+    order = np.argsort(-counts, kind="stable")
+    return [(str(turns.stage_names[i]), int(counts[i])) for i in order if counts[i]]
+
+
+def time_to_verification(turns, bins=TTV_BINS):
+    """Distribution of seconds from a session's first turn to its first VERIFIED turn"""
+    verified = turns.ranks == VERIFIED_RANK
+    sessions, first = np.unique(turns.sessions[verified], return_index=True)
+    seconds = (turns.times[verified][first] - turns.times[turns.starts][sessions]) / 1e6
+
+    if not len(seconds):
+        return {"verified_sessions": 0}
+
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99])
+    hist, edges = np.histogram(seconds, bins=bins)
+    return {
+        "verified_sessions": int(len(seconds)),
+        "mean": float(seconds.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(seconds.max()),
+        "histogram": [(float(lo), float(hi), int(n)) for lo, hi, n in zip(edges[:-1], edges[1:], hist)],
+    }
+
+
+def transitions(turns, top_n=10):
+    """Most frequent stage changes between consecutive turns of a session"""
+    if len(turns) < 2:
+        return []
+    k = len(turns.stage_names)
+    same_session = turns.sessions[1:] == turns.sessions[:-1]
+    src = turns.stages[:-1][same_session]
+    dst = turns.stages[1:][same_session]
+    # Turns without a stage ("") would otherwise show up as transitions
+    known = turns.stage_names != ""
+    keep = (src != dst) & known[src] & known[dst]
+    counts = np.bincount(src[keep] * k + dst[keep], minlength=k * k)
+    top = np.argsort(-counts, kind="stable")[:top_n]
+    return [(str(turns.stage_names[i // k]), str(turns.stage_names[i % k]), int(counts[i])) for i in top if counts[i]]
+
+
+def project_conversion(turns):
+    """Per interested project (each session's latest): sessions, phones collected, verified"""
+    if not len(turns):
+        return []
+    has_project = turns.projects >= 0
+    # Latest project of each session: first occurrence in the reversed columns
+    rev_sessions = turns.sessions[has_project][::-1]
+    rev_projects = turns.projects[has_project][::-1]
+    sessions, last = np.unique(rev_sessions, return_index=True)
+    session_project = rev_projects[last]
+
+    max_rank = turns.max_rank()[sessions]
+    n = len(turns.project_names)
+    totals = np.bincount(session_project, minlength=n)
+    phones = np.bincount(session_project, weights=max_rank >= PHONE_RANK, minlength=n)
+    verified = np.bincount(session_project, weights=max_rank == VERIFIED_RANK, minlength=n)
+
+    order = np.argsort(-totals, kind="stable")
+    return [{
+        "project": str(turns.project_names[i]),
+        "sessions": int(totals[i]),
+        "phone_collected": int(phones[i]),
+        "verified": int(verified[i]),
+        "conversion": float(verified[i] / totals[i]),
+    } for i in order if totals[i]]
+
+
+def get_funnel_report(start=None, end=None):
+    """All funnel metrics for turns logged between start and end (ISO timestamps)"""
+    turns = load_turns(start=start, end=end)
+    return {
+        "turns": len(turns),
+        "sessions": turns.n_sessions,
+        "funnel": funnel(turns),
+        "exit_stages": exit_stages(turns),
+        "time_to_verification": time_to_verification(turns),
+        "transitions": transitions(turns),
+        "projects": project_conversion(turns),
+    }
@@ -0,0 +1,199 @@
+# log_aggregates.py
+"""
+Analytics counters maintained as conversation logs are written.
+
+SqliteLogStore calls apply() in the same transaction that inserts the log
+rows, so the analytics summary reads a few small tables instead of scanning
+every log entry:
+- counters: total messages, visitors, leads captured, verified leads
+- session_stats: first/last message, message count and latest lead state per session
+- project_interest: sessions per interested project (each session's latest interest)
+- rollups: messages, new sessions and new leads per hour and per day
+
+rebuild() recomputes everything from the raw logs.
+"""
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_stats (
+    session_id TEXT PRIMARY KEY,
+    first_message TEXT,
+    last_message TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    lead_data TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS project_interest (
+    project TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,          -- "hour" or "day"
+    bucket TEXT NOT NULL,          -- "2025-01-31T14" or "2025-01-31"
+    messages INTEGER NOT NULL DEFAULT 0,
+    new_sessions INTEGER NOT NULL DEFAULT 0,
+    new_leads INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket)
+);
+"""
+
+COUNTERS = ("total_messages", "total_visitors", "leads_captured", "verified_leads")
+
+ROLLUP_PERIODS = {"hour": 13, "day": 10}  # ISO timestamp prefix length per bucket
+
+
+def create_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def is_built(conn):
+    """False for a database whose aggregates were never computed"""
+    return conn.execute("SELECT 1 FROM counters WHERE name = 'total_messages'").fetchone() is not None
+
+
+def _lead_flags(lead):
+    lead = lead or {}
+    return bool(lead.get("phone")), bool(lead.get("phone_verified")), lead.get("interested_project_name") or None
+
+
+def apply(conn, entries):
+    """Fold new log entries into the aggregates; the caller owns the transaction"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    projects = {}
+    rollups = {}
+    sessions = {}
+
+    def bump(timestamp, key):
+        for period, length in ROLLUP_PERIODS.items():
+            bucket = rollups.setdefault((period, (timestamp or "")[:length]), {"messages": 0, "new_sessions": 0, "new_leads": 0})
+            bucket[key] += 1
+
+    for entry in entries:
+        sid = entry.get("session_id")
+        timestamp = entry.get("timestamp")
+
+        state = sessions.get(sid)
+        if state is None:
+            row = conn.execute(
+                "SELECT first_message, message_count, lead_data FROM session_stats WHERE session_id = ?",
+                (sid,)
+            ).fetchone()
+            if row is None:
+                state = {"first": timestamp, "count": 0, "lead": {}}
+            else:
+                state = {"first": row[0], "count": row[1], "lead": json.loads(row[2])}
+            state["old_lead"] = state["lead"]
+            sessions[sid] = state
+
+        if state["count"] == 0:
+            counters["total_visitors"] += 1
+            bump(timestamp, "new_sessions")
+        state["count"] += 1
+        state["last"] = timestamp
+        counters["total_messages"] += 1
+        bump(timestamp, "messages")
+
+        # Same rule as get_all_sessions: the latest non-empty lead data wins
+        lead = entry.get("lead_data")
+        if lead:
+            if lead.get("phone") and not state["lead"].get("phone"):
+                bump(timestamp, "new_leads")
+            state["lead"] = lead
+
+    for sid, state in sessions.items():
+        old_phone, old_verified, old_project = _lead_flags(state["old_lead"])
+        new_phone, new_verified, new_project = _lead_flags(state["lead"])
+        counters["leads_captured"] += new_phone - old_phone
+        counters["verified_leads"] += new_verified - old_verified
+        if old_project != new_project:
+            if old_project:
+                projects[old_project] = projects.get(old_project, 0) - 1
+            if new_project:
+                projects[new_project] = projects.get(new_project, 0) + 1
+
+        conn.execute(
+            """INSERT INTO session_stats (session_id, first_message, last_message, message_count, lead_data)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(session_id) DO UPDATE SET
+                   last_message = excluded.last_message,
+                   message_count = excluded.message_count,
+                   lead_data = excluded.lead_data""",
+            (sid, state["first"], state["last"], state["count"], json.dumps(state["lead"], ensure_ascii=False))
+        )
+
+    conn.executemany(
+        """INSERT INTO counters (name, value) VALUES (?, ?)
+           ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""",
+        list(counters.items())
+    )
+    if projects:
+        conn.executemany(
+            """INSERT INTO project_interest (project, sessions) VALUES (?, ?)
+               ON CONFLICT(project) DO UPDATE SET sessions = sessions + excluded.sessions""",
+            list(projects.items())
+        )
+        conn.execute("DELETE FROM project_interest WHERE sessions <= 0")
+    conn.executemany(
+        """INSERT INTO rollups (period, bucket, messages, new_sessions, new_leads) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(period, bucket) DO UPDATE SET
+               messages = messages + excluded.messages,
+               new_sessions = new_sessions + excluded.new_sessions,
+               new_leads = new_leads + excluded.new_leads""",
+        [(period, bucket, c["messages"], c["new_sessions"], c["new_leads"]) for (period, bucket), c in rollups.items()]
+    )
+
+
+def rebuild(conn, entries, chunk_size=1000):
+    """Drop and recompute all aggregates from raw entries; the caller owns the transaction"""
+    for table in ("counters", "session_stats", "project_interest", "rollups"):
+        conn.execute(f"DELETE FROM {table}")
+    # Seed the counters so an empty log still counts as built
+    apply(conn, [])
+
+    count = 0
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            apply(conn, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        apply(conn, chunk)
+        count += len(chunk)
+    return count
+
+
+def summary(conn, top_n=5):
+    """Counters plus the top project interests"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update(conn.execute("SELECT name, value FROM counters").fetchall())
+    counters["top_projects"] = conn.execute(
+        "SELECT project, sessions FROM project_interest ORDER BY sessions DESC, project LIMIT ?",
+        (top_n,)
+    ).fetchall()
+    return counters
+
+
+def rollups(conn, period="day", limit=24):
+    """Most recent `limit` buckets of the given period, newest first"""
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown rollup period: {period}")
+    rows = conn.execute(
+        "SELECT bucket, messages, new_sessions, new_leads FROM rollups WHERE period = ? ORDER BY bucket DESC LIMIT ?",
+        (period, limit)
+    ).fetchall()
+    return [{"bucket": bucket, "messages": messages, "new_sessions": new_sessions, "new_leads": new_leads}
+            for bucket, messages, new_sessions, new_leads in rows]
+
+
+def compute(entries):
+    """Aggregates of a one-off scan, in a throwaway in-memory database"""
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    rebuild(conn, entries)
+    return conn
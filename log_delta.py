@@ -0,0 +1,48 @@
+# log_delta.py
+"""
+Delta encoding of lead snapshots for the compact log format.
+
+A delta holds only what changed since the session's previous log entry:
+    {"set": {key: value}, "unset": [key, ...], "append": {key: [new items]}}
+"append" covers lists that only grew (conversation_remarks), so a long list
+is not copied into every entry.
+"""
+
+
+def diff(old, new):
+    """Delta turning lead snapshot `old` into `new`"""
+    changed = {}
+    appended = {}
+    for key, value in new.items():
+        if key not in old:
+            changed[key] = value
+            continue
+        previous = old[key]
+        if previous == value:
+            continue
+        if (isinstance(value, list) and isinstance(previous, list)
+                and len(value) > len(previous) and value[:len(previous)] == previous):
+            appended[key] = value[len(previous):]
+        else:
+            changed[key] = value
+
+    delta = {}
+    if changed:
+        delta["set"] = changed
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta["unset"] = removed
+    if appended:
+        delta["append"] = appended
+    return delta
+
+
+def patch(old, delta):
+    """Apply a delta from diff() to a snapshot; returns a new snapshot"""
+    lead = dict(old)
+    for key in delta.get("unset", ()):
+        lead.pop(key, None)
+    lead.update(delta.get("set", {}))
+    for key, items in delta.get("append", {}).items():
+        lead[key] = list(lead.get(key) or []) + items
+    return lead
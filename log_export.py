@@ -0,0 +1,133 @@
+# log_export.py
+"""
+Streaming exports of the conversation logs.
+
+Entries are read from the log store in chunks and written out as they
+arrive, so memory stays flat however large the log is. Formats:
+- csv: one row per turn (the original export columns plus the stage)
+- columnar: JSON Lines, one row group of EXPORT_ROW_GROUP rows per line,
+  stored column by column with repeated values (session ids, names,
+  projects) dictionary-encoded; compact and quick to load into a dataframe
+
+Any format can be gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+from log_store import get_log_store
+
+EXPORT_ROW_GROUP = int(os.environ.get("EXPORT_ROW_GROUP", "1000"))
+
+EXPORT_FIELDS = [
+    'session_id', 'timestamp', 'stage', 'user_message', 'ai_response',
+    'name', 'phone', 'project_interest'
+]
+
+# Columns with few distinct values, stored as {"dict": [...], "codes": [...]}
+DICTIONARY_FIELDS = {'session_id', 'stage', 'name', 'phone', 'project_interest'}
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "columnar": ("application/x-ndjson", ".columnar.jsonl"),
+}
+
+
+def export_row(log):
+    """Flatten one log entry into the export columns"""
+    lead = log.get('lead_data') or {}
+    return {
+        'session_id': log.get('session_id'),
+        'timestamp': log.get('formatted_time'),
+        'stage': log.get('stage') or '',
+        'user_message': log.get('user_message'),
+        'ai_response': str(log.get('ai_response'))[:200],  # Truncate long responses
+        'name': lead.get('name') or '',
+        'phone': lead.get('phone') or '',
+        'project_interest': lead.get('interested_project_name') or ''
+    }
+
+
+def iter_csv(entries, rows_per_chunk=EXPORT_ROW_GROUP):
+    """CSV text in chunks of rows_per_chunk rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    rows = 0
+    for log in entries:
+        writer.writerow(export_row(log))
+        rows += 1
+        if rows % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _encode_column(field, values):
+    if field not in DICTIONARY_FIELDS:
+        return values
+    index = {}
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return {"dict": list(index), "codes": codes}
+
+
+def iter_columnar(entries, row_group=EXPORT_ROW_GROUP):
+    """Row groups as JSON lines: {"rows": n, "columns": {field: values}}"""
+    yield json.dumps({"format": "columnar", "fields": EXPORT_FIELDS}) + "\n"
+    columns = {field: [] for field in EXPORT_FIELDS}
+    rows = 0
+    for log in entries:
+        for field, value in export_row(log).items():
+            columns[field].append(value)
+        rows += 1
+        if rows == row_group:
+            yield _row_group(columns, rows)
+            columns = {field: [] for field in EXPORT_FIELDS}
+            rows = 0
+    if rows:
+        yield _row_group(columns, rows)
+
+
+def _row_group(columns, rows):
+    encoded = {field: _encode_column(field, values) for field, values in columns.items()}
+    return json.dumps({"rows": rows, "columns": encoded}, ensure_ascii=False) + "\n"
+
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of text chunks as it is produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(fmt="csv", start=None, end=None, session_id=None, compress=False):
+    """Export as a stream of str chunks (bytes when compress=True)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    entries = get_log_store().iter_entries(start=start, end=end, session_id=session_id)
+    chunks = iter_csv(entries) if fmt == "csv" else iter_columnar(entries)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(fmt="csv", compress=False):
+    return f"conversation_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXPORT_FORMATS[fmt][1]}{'.gz' if compress else ''}"
+
+
+def export_logs(path=None, fmt="csv", start=None, end=None, session_id=None, compress=False):
+    """Stream an export to a file; returns the file name"""
+    path = path or export_filename(fmt, compress)
+    mode = 'wb' if compress else 'w'
+    kwargs = {} if compress else {"newline": "", "encoding": "utf-8"}
+    with open(path, mode, **kwargs) as f:
+        for chunk in iter_export(fmt, start=start, end=end, session_id=session_id, compress=compress):
+            f.write(chunk)
+    print(f"✅ Exported logs to {path}")
+    return path
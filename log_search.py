@@ -0,0 +1,114 @@
+# log_search.py
+"""
+Full-text search over conversation logs.
+
+SqliteLogStore keeps an FTS5 index (logs_fts) over each turn's user message
+and the text of the AI reply blocks, written in the same transaction as the
+log rows. The index is contentless: it stores only the postings and points
+back to logs.id, so it does not duplicate the log text. If this SQLite build
+lacks FTS5, searches fall back to scanning the logs.
+
+Queries are plain words; a turn matches when it contains all of them
+(prefix matches too, so "possess" finds "possession"). Results are sessions,
+most recently active first.
+"""
+import json
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE VIRTUAL TABLE logs_fts USING fts5(
+    user_message,
+    ai_text,
+    content='',
+    tokenize='porter unicode61'
+)
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def create_schema(conn):
+    """Create the index; returns "created", "exists" or None if FTS5 is unavailable"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'logs_fts'").fetchone():
+        return "exists"
+    try:
+        conn.execute(SCHEMA)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ SQLite FTS5 not available ({e}), log search will scan")
+        return None
+    return "created"
+
+
+def response_text(ai_response):
+    """Searchable text of an AI reply: every string inside its blocks' props"""
+    try:
+        reply = json.loads(ai_response)
+    except (TypeError, ValueError):
+        return ai_response or ""
+    if not isinstance(reply, dict):
+        return ai_response or ""
+
+    parts = []
+
+    def collect(value):
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    for block in reply.get("blocks") or []:
+        if isinstance(block, dict):
+            collect(block.get("props"))
+    return "\n".join(parts)
+
+
+def search_terms(query):
+    return [word.lower() for word in _WORD.findall(query or "")]
+
+
+def fts_query(terms):
+    """FTS5 MATCH expression: all terms, each as a quoted prefix"""
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def index(conn, rows):
+    """Add (log id, user_message, ai_response) rows to the index"""
+    conn.executemany(
+        "INSERT INTO logs_fts (rowid, user_message, ai_text) VALUES (?, ?, ?)",
+        [(row_id, user_message or "", response_text(ai_response)) for row_id, user_message, ai_response in rows]
+    )
+
+
+def matches(entry, terms):
+    """Scan-path equivalent of the FTS match (substring, case-insensitive)"""
+    text = f"{entry.get('user_message') or ''}\n{response_text(entry.get('ai_response'))}".lower()
+    return all(term in text for term in terms)
+
+
+def scan(entries, terms, limit=20):
+    """Search by reading every entry (JSONL backend, or SQLite without FTS5)"""
+    found = {}
+    for position, entry in enumerate(entries):
+        if matches(entry, terms):
+            hit = found.setdefault(entry.get("session_id"), {"hits": 0})
+            hit.update(position=position, entry=entry)
+            hit["hits"] += 1
+    ranked = sorted(found.items(), key=lambda item: item[1]["position"], reverse=True)[:limit]
+    return [result(session_id, hit["hits"], hit["entry"]) for session_id, hit in ranked]
+
+
+def result(session_id, hits, entry):
+    """One search result: the session and its latest matching turn"""
+    return {
+        "session_id": session_id,
+        "hits": hits,
+        "timestamp": entry.get("timestamp"),
+        "formatted_time": entry.get("formatted_time"),
+        "user_message": entry.get("user_message"),
+        "lead_data": entry.get("lead_data") or {},
+    }
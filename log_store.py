@@ -0,0 +1,648 @@
+# log_store.py
+"""
+Storage engines for conversation logs.
+
+- JsonlLogStore: append-only JSON Lines file, every read is a full scan
+- SqliteLogStore: SQLite in WAL mode with indexes on session_id and timestamp,
+  so session lookups and "last N" are index reads, plus analytics aggregates
+  updated on every write (see log_aggregates.py) and a full-text index
+  (see log_search.py) (default)
+
+With LOG_COMPACT=1 (default) the SQLite store writes a compact format: lead
+data as per-session deltas (log_delta.py) with a full snapshot every
+LOG_KEYFRAME_INTERVAL entries, AI responses stored once per distinct body in
+a content-addressed table, and formatted_time derived from the timestamp.
+Readers always get full entries back.
+
+Select with LOG_BACKEND=sqlite|jsonl.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import log_aggregates
+import log_delta
+import log_search
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-process use only
+    fcntl = None
+
+LOG_BACKEND = os.environ.get("LOG_BACKEND", "sqlite")
+
+# One JSON object per line (append-only)
+LOG_FILE = os.environ.get("LOG_FILE", "conversation_logs.jsonl")
+
+# Previous format: one JSON array rewritten on every turn
+LEGACY_LOG_FILE = "conversation_logs.json"
+
+LOG_DB_FILE = os.environ.get("LOG_DB_FILE", "conversation_logs.db")
+
+LOG_COMPACT = os.environ.get("LOG_COMPACT", "1") == "1"
+# Deltas between full lead snapshots; bounds the work to rebuild any one entry
+LOG_KEYFRAME_INTERVAL = int(os.environ.get("LOG_KEYFRAME_INTERVAL", "20"))
+# Sessions whose latest lead snapshot is kept in memory for encoding/decoding
+LOG_DELTA_CACHE = int(os.environ.get("LOG_DELTA_CACHE", "10000"))
+
+
+def _lock(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+def _unlock(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class JsonlLogStore:
+    def __init__(self, path=LOG_FILE, legacy_path=LEGACY_LOG_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._migrate_lock = threading.Lock()
+        self._migrated = False
+
+    def migrate_legacy(self):
+        """One-time conversion of the old JSON array log into the JSONL log.
+
+        Legacy entries are older than anything already in the JSONL file, so
+        they are written first. The legacy file is renamed to *.migrated
+        afterwards. Returns the number of migrated entries.
+        """
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return 0
+
+        try:
+            with open(self.legacy_path, 'r') as f:
+                legacy_logs = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read legacy log file {self.legacy_path}: {e}")
+            return 0
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            _lock(fd)
+            # Another worker may have finished the migration while we waited
+            if not os.path.exists(self.legacy_path):
+                return 0
+            with open(self.path, 'rb') as f:
+                existing = f.read()
+            # Rewrite in place (not via rename) so writers already waiting on
+            # this file's lock append to the migrated file, not an orphaned one
+            data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in legacy_logs).encode("utf-8") + existing
+            os.ftruncate(fd, 0)
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            os.fsync(fd)
+            os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+        finally:
+            _unlock(fd)
+            os.close(fd)
+
+        print(f"✅ Migrated {len(legacy_logs)} log entries from {self.legacy_path} to {self.path}")
+        return len(legacy_logs)
+
+    def _ensure_migrated(self):
+        if self._migrated:
+            return
+        with self._migrate_lock:
+            if not self._migrated:
+                self.migrate_legacy()
+                self._migrated = True
+
+    def append(self, entries, sync=False):
+        """Append entries as whole lines in one write, atomically with respect to other writers"""
+        if not entries:
+            return
+        self._ensure_migrated()
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            _lock(fd)
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            if sync:
+                os.fsync(fd)
+        finally:
+            _unlock(fd)
+            os.close(fd)
+
+    def iter_entries(self, start=None, end=None, session_id=None):
+        """Yield log entries in write order without loading the whole file.
+
+        start/end are ISO timestamps (start inclusive, end exclusive).
+        """
+        for entry in self._scan():
+            if session_id is not None and entry.get("session_id") != session_id:
+                continue
+            timestamp = entry.get("timestamp") or ""
+            if (start and timestamp < start) or (end and timestamp >= end):
+                continue
+            yield entry
+
+    def _scan(self):
+        self._ensure_migrated()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn line from a crash mid-write; skip it
+                    continue
+
+    def iter_funnel_rows(self, start=None, end=None, chunk_size=50000):
+        """Lists of (session_id, timestamp, stage, interested_project_name) tuples in write order"""
+        chunk = []
+        for log in self.iter_entries(start=start, end=end):
+            chunk.append((
+                log.get("session_id"),
+                log.get("timestamp"),
+                log.get("stage"),
+                (log.get("lead_data") or {}).get("interested_project_name"),
+            ))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def count(self):
+        return sum(1 for _ in self.iter_entries())
+
+    def session_entries(self, session_id):
+        return [log for log in self.iter_entries() if log.get("session_id") == session_id]
+
+    def recent(self, limit):
+        """Last `limit` entries, newest first"""
+        if limit <= 0:
+            return []
+        tail = []
+        for log in self.iter_entries():
+            tail.append(log)
+            if len(tail) > limit:
+                tail.pop(0)
+        return tail[::-1]
+
+    def sessions(self):
+        sessions = {}
+
+        for log in self.iter_entries():
+            sid = log.get("session_id")
+            if sid not in sessions:
+                sessions[sid] = {
+                    "session_id": sid,
+                    "first_message": log.get("timestamp"),
+                    "last_message": log.get("timestamp"),
+                    "message_count": 0,
+                    "lead_info": {}
+                }
+
+            sessions[sid]["message_count"] += 1
+            sessions[sid]["last_message"] = log.get("timestamp")
+
+            # Update lead info if available
+            if log.get("lead_data"):
+                sessions[sid]["lead_info"] = log.get("lead_data")
+
+        return list(sessions.values())
+
+    def analytics(self, top_n=5):
+        """Analytics summary; the JSONL backend has to scan the whole file"""
+        return log_aggregates.summary(log_aggregates.compute(self.iter_entries()), top_n)
+
+    def rollups(self, period="day", limit=24):
+        return log_aggregates.rollups(log_aggregates.compute(self.iter_entries()), period, limit)
+
+    def rebuild_aggregates(self):
+        """Nothing is precomputed for JSONL; returns the number of entries"""
+        return self.count()
+
+    def rebuild_search_index(self):
+        """JSONL searches scan the file; there is no index to rebuild"""
+        return 0
+
+    def search(self, query, limit=20):
+        """Sessions with turns matching every word of query, latest match first"""
+        terms = log_search.search_terms(query)
+        return log_search.scan(self.iter_entries(), terms, limit) if terms else []
+
+
+def _format_time(timestamp):
+    """formatted_time as log_conversation writes it, from the ISO timestamp"""
+    return timestamp[:19].replace("T", " ") if timestamp else None
+
+
+def _remember(leads, session_id, state):
+    leads[session_id] = state
+    leads.move_to_end(session_id)
+    if len(leads) > LOG_DELTA_CACHE:
+        leads.popitem(last=False)
+
+
+class SqliteLogStore:
+    def __init__(self, path=LOG_DB_FILE, import_from=None, compact=LOG_COMPACT):
+        self.path = path
+        self.compact = compact
+        self._local = threading.local()
+        # session_id -> (id of its latest row, lead snapshot, deltas since keyframe)
+        self._last_lead = OrderedDict()
+        self._last_lead_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                formatted_time TEXT,
+                user_message TEXT,
+                ai_response TEXT,
+                lead_data TEXT NOT NULL DEFAULT '{}',
+                stage TEXT,
+                lead_base INTEGER,     -- NULL: lead_data is a snapshot; else a delta on that row
+                response_hash TEXT     -- set when ai_response is stored in responses
+            );
+            CREATE INDEX IF NOT EXISTS idx_logs_session ON logs(session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);
+            CREATE TABLE IF NOT EXISTS responses (
+                hash TEXT PRIMARY KEY,
+                body TEXT NOT NULL
+            );
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(logs)")}
+        for column in ("stage TEXT", "lead_base INTEGER", "response_hash TEXT"):
+            if column.split()[0] not in columns:
+                conn.execute(f"ALTER TABLE logs ADD COLUMN {column}")
+        log_aggregates.create_schema(conn)
+        fts = log_search.create_schema(conn)
+        self._fts = fts is not None
+        conn.commit()
+        if fts == "created" and conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone():
+            # Database from before the search index existed
+            self.rebuild_search_index()
+        if import_from is not None:
+            self._import_once(import_from)
+        if not log_aggregates.is_built(conn):
+            # Database from before the aggregates existed
+            self.rebuild_aggregates()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Every commit is fsynced; the log writer commits once per batch
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _import_once(self, jsonl_store):
+        """Copy an existing JSONL (or legacy JSON) log into an empty database"""
+        if not os.path.exists(jsonl_store.path) and not os.path.exists(jsonl_store.legacy_path or ""):
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone():
+                conn.rollback()
+                return 0
+            count = 0
+            batch = []
+            for entry in jsonl_store.iter_entries():
+                batch.append(entry)
+                if len(batch) >= 1000:
+                    self._insert(conn, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._insert(conn, batch)
+                count += len(batch)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._forget_leads()
+            raise
+        if os.path.exists(jsonl_store.path):
+            os.replace(jsonl_store.path, f"{jsonl_store.path}.migrated")
+        print(f"✅ Imported {count} log entries from {jsonl_store.path} into {self.path}")
+        return count
+
+    _INSERT = """INSERT INTO logs (session_id, timestamp, formatted_time, user_message, ai_response, lead_data, stage,
+                                   lead_base, response_hash)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+    _SELECT = """SELECT l.id, l.session_id, l.timestamp, l.formatted_time, l.user_message,
+                        COALESCE(l.ai_response, r.body), l.lead_data, l.stage, l.lead_base
+                 FROM logs l LEFT JOIN responses r ON r.hash = l.response_hash"""
+
+    def append(self, entries, sync=False):
+        """Insert entries in a single transaction (one commit, one fsync per call)"""
+        if not entries:
+            return
+        conn = self._conn()
+        # IMMEDIATE: delta encoding reads each session's latest row before writing
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert(conn, entries)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._forget_leads()
+            raise
+
+    def _insert(self, conn, entries):
+        row_ids = []
+        for entry in entries:
+            if self.compact:
+                row, lead, deltas = self._compact_row(conn, entry)
+                row_id = conn.execute(self._INSERT, row).lastrowid
+                with self._last_lead_lock:
+                    _remember(self._last_lead, entry.get("session_id"), (row_id, lead, deltas))
+            else:
+                row_id = conn.execute(self._INSERT, self._entry_row(entry)).lastrowid
+            row_ids.append(row_id)
+        log_aggregates.apply(conn, entries)
+        if self._fts:
+            log_search.index(conn, [
+                (row_id, entry.get("user_message"), entry.get("ai_response"))
+                for row_id, entry in zip(row_ids, entries)
+            ])
+
+    @staticmethod
+    def _entry_row(entry):
+        return (
+            entry.get("session_id"),
+            entry.get("timestamp"),
+            entry.get("formatted_time"),
+            entry.get("user_message"),
+            entry.get("ai_response"),
+            json.dumps(entry.get("lead_data") or {}, ensure_ascii=False),
+            entry.get("stage"),
+            None,
+            None,
+        )
+
+    def _compact_row(self, conn, entry):
+        """Row for the compact format, plus the lead snapshot and delta count to cache"""
+        session_id = entry.get("session_id")
+        lead = entry.get("lead_data") or {}
+
+        last_id = conn.execute("SELECT MAX(id) FROM logs WHERE session_id = ?", (session_id,)).fetchone()[0]
+        with self._last_lead_lock:
+            state = self._last_lead.get(session_id)
+        # Only delta against the cached snapshot if it is still the session's latest row
+        if state is None or state[0] != last_id or state[2] >= LOG_KEYFRAME_INTERVAL:
+            base, lead_data, deltas = None, lead, 0
+        else:
+            base, lead_data, deltas = last_id, log_delta.diff(state[1], lead), state[2] + 1
+
+        response = entry.get("ai_response")
+        response_hash = None
+        if isinstance(response, str):
+            response_hash = hashlib.sha1(response.encode("utf-8")).hexdigest()
+            conn.execute("INSERT OR IGNORE INTO responses (hash, body) VALUES (?, ?)", (response_hash, response))
+            response = None
+
+        row = (
+            session_id,
+            entry.get("timestamp"),
+            None,  # derived from timestamp on read
+            entry.get("user_message"),
+            response,
+            json.dumps(lead_data, ensure_ascii=False),
+            entry.get("stage"),
+            base,
+            response_hash,
+        )
+        return row, lead, deltas
+
+    def _forget_leads(self):
+        """Drop cached snapshots, e.g. after a rolled back insert"""
+        with self._last_lead_lock:
+            self._last_lead.clear()
+
+    def _entries(self, rows, leads):
+        """Full entries from _SELECT rows in id order, rebuilding delta-encoded leads"""
+        entries = []
+        for row_id, session_id, timestamp, formatted_time, user_message, ai_response, lead_data, stage, base in rows:
+            lead = json.loads(lead_data) if lead_data else {}
+            if base is not None:
+                previous = leads.get(session_id)
+                if previous is None or previous[0] != base:
+                    previous = (base, self._lead_at(base, session_id))
+                lead = log_delta.patch(previous[1], lead)
+            _remember(leads, session_id, (row_id, lead))
+            entries.append({
+                "session_id": session_id,
+                "timestamp": timestamp,
+                "formatted_time": formatted_time or _format_time(timestamp),
+                "user_message": user_message,
+                "ai_response": ai_response,
+                "lead_data": lead,
+                "stage": stage,
+            })
+        return entries
+
+    def _lead_at(self, row_id, session_id):
+        """Lead snapshot as of row_id: the keyframe before it plus the deltas since"""
+        rows = self._conn().execute(
+            """SELECT lead_data, lead_base FROM logs
+               WHERE session_id = ? AND id <= ?
+                 AND id >= (SELECT MAX(id) FROM logs WHERE session_id = ? AND id <= ? AND lead_base IS NULL)
+               ORDER BY id""",
+            (session_id, row_id, session_id, row_id)
+        ).fetchall()
+        lead = {}
+        for lead_data, base in rows:
+            data = json.loads(lead_data) if lead_data else {}
+            lead = data if base is None else log_delta.patch(lead, data)
+        return lead
+
+    def iter_entries(self, start=None, end=None, session_id=None, chunk_size=1000):
+        """Yield entries in write order, reading chunk_size rows at a time.
+
+        start/end are ISO timestamps (start inclusive, end exclusive).
+        """
+        filters = ""
+        params = []
+        if session_id is not None:
+            filters += " AND l.session_id = ?"
+            params.append(session_id)
+        if start:
+            filters += " AND l.timestamp >= ?"
+            params.append(start)
+        if end:
+            filters += " AND l.timestamp < ?"
+            params.append(end)
+
+        leads = OrderedDict()
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"{self._SELECT} WHERE l.id > ?{filters} ORDER BY l.id LIMIT ?",
+                (last_id, *params, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield from self._entries(rows, leads)
+            last_id = rows[-1][0]
+
+    def iter_funnel_rows(self, start=None, end=None, chunk_size=50000):
+        """Lists of (session_id, timestamp, stage, interested_project_name) tuples in write order"""
+        filters = ""
+        params = []
+        if start:
+            filters += " AND timestamp >= ?"
+            params.append(start)
+        if end:
+            filters += " AND timestamp < ?"
+            params.append(end)
+
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"""SELECT id, session_id, timestamp, stage,
+                           CASE WHEN lead_base IS NULL THEN json_extract(lead_data, '$.interested_project_name')
+                                ELSE json_extract(lead_data, '$.set.interested_project_name') END
+                    FROM logs WHERE id > ?{filters} ORDER BY id LIMIT ?""",
+                (last_id, *params, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[1:] for row in rows]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    def session_entries(self, session_id):
+        rows = self._conn().execute(
+            f"{self._SELECT} WHERE l.session_id = ? ORDER BY l.id",
+            (session_id,)
+        ).fetchall()
+        return self._entries(rows, OrderedDict())
+
+    def recent(self, limit):
+        """Last `limit` entries, newest first"""
+        rows = self._conn().execute(
+            f"{self._SELECT} ORDER BY l.id DESC LIMIT ?",
+            (max(0, limit),)
+        ).fetchall()
+        return self._entries(rows[::-1], OrderedDict())[::-1]
+
+    def sessions(self):
+        rows = self._conn().execute(
+            """SELECT session_id, first_message, last_message, message_count, lead_data
+               FROM session_stats ORDER BY rowid"""
+        ).fetchall()
+        return [{
+            "session_id": sid,
+            "first_message": first,
+            "last_message": last,
+            "message_count": count,
+            "lead_info": json.loads(lead) if lead else {}
+        } for sid, first, last, count, lead in rows]
+
+    def analytics(self, top_n=5):
+        """Analytics summary read from the precomputed aggregates"""
+        return log_aggregates.summary(self._conn(), top_n)
+
+    def rollups(self, period="day", limit=24):
+        """Messages, new sessions and new leads per hour or day, newest first"""
+        return log_aggregates.rollups(self._conn(), period, limit)
+
+    def rebuild_aggregates(self):
+        """Recompute all aggregates from the raw logs; returns the number of entries"""
+        conn = self._conn()
+        # BEGIN IMMEDIATE holds off writers so no entry is counted twice or missed
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = log_aggregates.rebuild(conn, self.iter_entries())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"✅ Rebuilt analytics aggregates from {count} log entries")
+        return count
+
+    def rebuild_search_index(self, chunk_size=1000):
+        """Re-index every log entry for full-text search; returns the number indexed"""
+        if not self._fts:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('delete-all')")
+            count = 0
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    """SELECT l.id, l.user_message, COALESCE(l.ai_response, r.body)
+                       FROM logs l LEFT JOIN responses r ON r.hash = l.response_hash
+                       WHERE l.id > ? ORDER BY l.id LIMIT ?""",
+                    (last_id, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                log_search.index(conn, rows)
+                count += len(rows)
+                last_id = rows[-1][0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"✅ Indexed {count} log entries for search")
+        return count
+
+    def search(self, query, limit=20):
+        """Sessions with turns matching every word of query, latest match first"""
+        terms = log_search.search_terms(query)
+        if not terms:
+            return []
+        if not self._fts:
+            return log_search.scan(self.iter_entries(), terms, limit)
+
+        conn = self._conn()
+        rows = conn.execute(
+            """SELECT l.session_id, COUNT(*), MAX(l.id)
+               FROM logs_fts JOIN logs l ON l.id = logs_fts.rowid
+               WHERE logs_fts MATCH ?
+               GROUP BY l.session_id
+               ORDER BY MAX(l.id) DESC
+               LIMIT ?""",
+            (log_search.fts_query(terms), limit)
+        ).fetchall()
+        results = []
+        for session_id, hits, last_id in rows:
+            # Rebuild the latest matching entry (its lead may be delta-encoded)
+            entry = self._entries(conn.execute(f"{self._SELECT} WHERE l.id = ?", (last_id,)).fetchall(), OrderedDict())[0]
+            results.append(log_search.result(session_id, hits, entry))
+        return results
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_log_store():
+    """Process-wide log store selected by LOG_BACKEND"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            jsonl_store = JsonlLogStore()
+            if LOG_BACKEND == "jsonl":
+                _store = jsonl_store
+            else:
+                _store = SqliteLogStore(import_from=jsonl_store)
+        return _store
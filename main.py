@@ -1,10 +1,15 @@
 # main.py
-from agent_logic import run_conversation, lead_data
+from agent_logic import run_conversation, session_store
+from session_store import new_session_id
 import sys
 import json
 
+# One session for the whole CLI chat
+session_id = new_session_id()
+
 def print_lead_status():
     """Print current lead status"""
+    lead_data = session_store.get(session_id).lead
     print("\n" + "="*60)
     print("📊 CURRENT LEAD STATUS:")
     print("="*60)
@@ -43,7 +48,7 @@ def start_chat():
             print("\n🤖 Agent is thinking...\n")
             
             # Run conversation
-            response = run_conversation(user_input)
+            response = run_conversation(user_input, session_id=session_id)
             
             # Parse and display response
             try:
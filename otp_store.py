@@ -0,0 +1,161 @@
+# otp_store.py
+"""
+Storage for one-time passwords sent during phone verification.
+
+Every OTP expires after OTP_TTL_SECONDS and allows OTP_MAX_ATTEMPTS wrong
+guesses before it is burned. A correct code can only be used once, even if
+two requests race on it. Two backends:
+- InMemoryOtpStore: thread-safe dict for a single worker, with lazy expiry
+  on access, a periodic sweep on put and verify, and a hard cap of
+  OTP_MAX_ENTRIES codes
+- RespOtpStore: Redis (or anything speaking RESP), shared by all workers,
+  with expiry done by the server
+
+Pick one with OTP_STORE=memory|redis (default memory).
+"""
+from collections import OrderedDict
+import hmac
+import os
+import threading
+import time
+
+from resp_client import RespClient, RespError
+
+OTP_STORE = os.environ.get("OTP_STORE", "memory")
+OTP_REDIS_URL = os.environ.get("OTP_REDIS_URL", "redis://localhost:6379/0")
+OTP_TTL_SECONDS = int(os.environ.get("OTP_TTL_SECONDS", "300"))
+OTP_MAX_ATTEMPTS = int(os.environ.get("OTP_MAX_ATTEMPTS", "5"))
+OTP_MAX_ENTRIES = int(os.environ.get("OTP_MAX_ENTRIES", "100000"))
+OTP_SWEEP_INTERVAL = int(os.environ.get("OTP_SWEEP_INTERVAL", "60"))
+
+# verify() results
+OTP_OK = "ok"
+OTP_MISSING = "missing"        # never sent, expired, or already used
+OTP_MISMATCH = "mismatch"
+OTP_LOCKED = "locked"          # too many wrong guesses; a new code is needed
+
+
+class InMemoryOtpStore:
+    def __init__(self, ttl=OTP_TTL_SECONDS, max_attempts=OTP_MAX_ATTEMPTS,
+                 max_entries=OTP_MAX_ENTRIES, sweep_interval=OTP_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        # phone -> [otp, expires_at, wrong_attempts], oldest first
+        self._codes = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def put(self, phone, otp):
+        now = time.monotonic()
+        with self._lock:
+            self._codes.pop(phone, None)
+            self._codes[phone] = [otp, now + self.ttl, 0]
+            self._maybe_sweep(now)
+            # Bot traffic can't grow memory past the cap: drop the oldest codes
+            while len(self._codes) > self.max_entries:
+                self._codes.popitem(last=False)
+
+    def verify(self, phone, otp):
+        now = time.monotonic()
+        with self._lock:
+            # Workers that mostly verify must drop dead codes too
+            self._maybe_sweep(now)
+            entry = self._codes.get(phone)
+            if entry is None:
+                return OTP_MISSING
+            if entry[1] <= now:
+                del self._codes[phone]
+                return OTP_MISSING
+            if hmac.compare_digest(entry[0], otp):
+                del self._codes[phone]
+                return OTP_OK
+            entry[2] += 1
+            if entry[2] >= self.max_attempts:
+                del self._codes[phone]
+                return OTP_LOCKED
+            return OTP_MISMATCH
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+    def _sweep(self, now):
+        """Drop expired codes. Same TTL for all, so they expire in insertion order"""
+        self._last_sweep = now
+        while self._codes:
+            phone, entry = next(iter(self._codes.items()))
+            if entry[1] > now:
+                break
+            del self._codes[phone]
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class RespOtpStore:
+    """OTPs in Redis: otp:<phone> holds the code, otp:tries:<phone> the wrong guesses"""
+
+    def __init__(self, client, ttl=OTP_TTL_SECONDS, max_attempts=OTP_MAX_ATTEMPTS, prefix="otp:"):
+        self.client = client
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+
+    def _keys(self, phone):
+        return f"{self.prefix}{phone}", f"{self.prefix}tries:{phone}"
+
+    def _pipeline(self, commands):
+        """client.pipeline, raising the first error reply instead of returning it"""
+        replies = self.client.pipeline(commands)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def put(self, phone, otp):
+        code_key, tries_key = self._keys(phone)
+        # A failed SET must not look like a sent code
+        self._pipeline([
+            ("SET", code_key, otp, "EX", self.ttl),
+            ("DEL", tries_key),
+        ])
+
+    def verify(self, phone, otp):
+        code_key, tries_key = self._keys(phone)
+        stored = self.client.execute("GET", code_key)
+        if stored is None:
+            return OTP_MISSING
+        if hmac.compare_digest(stored, otp):
+            # Only the request whose DEL removed the key wins; a concurrent
+            # verify of the same code sees 0 and fails
+            if self.client.execute("DEL", code_key) == 1:
+                self.client.execute("DEL", tries_key)
+                return OTP_OK
+            return OTP_MISSING
+        tries, _ = self._pipeline([
+            ("INCR", tries_key),
+            ("EXPIRE", tries_key, self.ttl),
+        ])
+        if tries >= self.max_attempts:
+            self.client.execute("DEL", code_key, tries_key)
+            return OTP_LOCKED
+        return OTP_MISMATCH
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """Process-wide store selected by OTP_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if OTP_STORE == "redis":
+                _store = RespOtpStore(RespClient.from_url(OTP_REDIS_URL))
+                print(f"🗄️ Using Redis OTP store ({OTP_REDIS_URL})")
+            else:
+                _store = InMemoryOtpStore()
+        return _store
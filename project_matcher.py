@@ -0,0 +1,246 @@
+# project_matcher.py
+"""
+Project-name detection for user messages.
+
+A ProjectMatcher is compiled once per catalog version. Exact references
+(names, slugs, aliases, "sector NN") are found with a single Aho-Corasick
+pass over the message; when nothing matches exactly, a character-trigram
+index narrows down fuzzy candidates so typos still resolve to a project.
+"""
+from collections import namedtuple, defaultdict, deque
+from difflib import SequenceMatcher
+import json
+import os
+import re
+import threading
+
+# Extra names users call projects by, keyed by project id or project name.
+# Can be extended with a JSON file of the same shape via PROJECT_ALIASES_FILE.
+PROJECT_ALIASES = {}
+PROJECT_ALIASES_FILE = os.environ.get("PROJECT_ALIASES_FILE")
+
+# Minimum score for a candidate to count as "the" project the user means
+PROJECT_MATCH_THRESHOLD = float(os.environ.get("PROJECT_MATCH_THRESHOLD", "0.6"))
+
+# Base score per kind of reference
+TERM_WEIGHTS = {
+    "name": 1.0,
+    "alias": 0.95,
+    "slug": 0.9,
+    "sector": 0.7,
+}
+FUZZY_WEIGHT = 0.85
+FUZZY_MIN_SIMILARITY = 0.75
+
+# Short or generic words are never matched fuzzily on their own
+_MIN_FUZZY_TERM_LENGTH = 4
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_SECTOR_RE = re.compile(r"sector\s+(\d+[a-z]?)", re.IGNORECASE)
+# Trailing slug words that say where a project is, not which one it is
+_SLUG_PLACE_WORDS = frozenset(["sector", "sec", "phase", "gurugram", "gurgaon", "delhi", "ncr", "noida", "india"])
+
+ProjectMatch = namedtuple("ProjectMatch", ["project", "score", "term", "kind"])
+
+
+def normalize_text(text):
+    """Lowercase, turn punctuation into spaces and collapse whitespace"""
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _load_alias_file():
+    if not PROJECT_ALIASES_FILE or not os.path.exists(PROJECT_ALIASES_FILE):
+        return {}
+    try:
+        with open(PROJECT_ALIASES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Could not load project aliases: {str(e)}")
+        return {}
+
+
+class _AhoCorasick:
+    """Minimal Aho-Corasick automaton over normalized strings"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(pattern_id)
+
+        # Depth-1 states fail to the root; deeper ones are filled breadth-first
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                if state:
+                    self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yield pattern ids of every occurrence in text"""
+        state = 0
+        for ch in text:
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pattern_id in self.output[state]:
+                yield pattern_id
+
+
+class ProjectMatcher:
+    """Ranks catalog projects referenced in a message"""
+
+    def __init__(self, projects, aliases=None):
+        self.projects = list(projects)
+        aliases = {**PROJECT_ALIASES, **_load_alias_file(), **(aliases or {})}
+
+        # (normalized term, project index, kind); one project can own many terms
+        terms = {}
+        sector_owners = defaultdict(set)
+        for idx, p in enumerate(self.projects):
+            city_words = normalize_text((p.location or "").split(",")[0]).split()
+            candidates = [(p.name, "name"), (self._slug_name(p.slug, city_words), "slug")]
+            for key in (p.id, p.name):
+                candidates.extend((a, "alias") for a in aliases.get(key, []))
+            for raw, kind in candidates:
+                term = normalize_text(raw)
+                if term:
+                    # Keep the strongest kind if two references normalize alike
+                    current = terms.get((term, idx))
+                    if current is None or TERM_WEIGHTS[kind] > TERM_WEIGHTS[current]:
+                        terms[(term, idx)] = kind
+            sector = _SECTOR_RE.search(p.location or "")
+            if sector:
+                sector_owners[f"sector {sector.group(1).lower()}"].add(idx)
+
+        self.terms = [(term, idx, kind) for (term, idx), kind in terms.items()]
+        for term, owners in sector_owners.items():
+            # A sector shared by several projects is a weaker signal for each
+            for idx in owners:
+                self.terms.append((term, idx, "sector"))
+        self._sector_share = {term: len(owners) for term, owners in sector_owners.items()}
+
+        # Patterns are padded with spaces so they only match whole words
+        self._automaton = _AhoCorasick([f" {term} " for term, _, _ in self.terms])
+
+        self._trigram_index = defaultdict(list)
+        for term_id, (term, _, kind) in enumerate(self.terms):
+            if kind != "sector" and len(term) >= _MIN_FUZZY_TERM_LENGTH:
+                for gram in _trigrams(term):
+                    self._trigram_index[gram].append(term_id)
+
+    @staticmethod
+    def _slug_name(slug, city_words=()):
+        """'amogh-residency-49-abc' or 'amogh-residency-sector-49-gurugram' -> 'amogh residency'"""
+        words = [w for w in (slug or "").lower().split("-") if w]
+        while words and (
+            any(c.isdigit() for c in words[-1])
+            or words[-1] in _SLUG_PLACE_WORDS or words[-1] in city_words
+            or len(words) > 1 and words[-2].isdigit()
+        ):
+            words.pop()
+        return " ".join(words)
+
+    def _score(self, term, kind):
+        score = TERM_WEIGHTS[kind]
+        if kind == "sector":
+            score /= self._sector_share.get(term, 1)
+        return score
+
+    def match(self, message, limit=5):
+        """Return up to `limit` ProjectMatch candidates, best first"""
+        text = normalize_text(message)
+        if not text:
+            return []
+
+        best = {}
+        for term_id in self._automaton.iter_matches(f" {text} "):
+            term, idx, kind = self.terms[term_id]
+            # Longer exact references beat shorter ones of the same kind
+            score = self._score(term, kind) + min(len(term), 40) / 1000
+            if idx not in best or score > best[idx].score:
+                best[idx] = ProjectMatch(self.projects[idx], round(score, 3), term, kind)
+
+        if not any(m.score >= PROJECT_MATCH_THRESHOLD for m in best.values()):
+            for idx, m in self._fuzzy_matches(text):
+                if idx not in best or m.score > best[idx].score:
+                    best[idx] = m
+
+        return sorted(best.values(), key=lambda m: m.score, reverse=True)[:limit]
+
+    def best_match(self, message):
+        """The single project the message refers to, if confident enough"""
+        return confident_match(self.match(message, limit=1))
+
+    def _fuzzy_matches(self, text):
+        grams = _trigrams(text)
+        hits = defaultdict(int)
+        for gram in grams:
+            for term_id in self._trigram_index.get(gram, ()):
+                hits[term_id] += 1
+
+        words = text.split()
+        results = []
+        # Only verify the terms sharing the most trigrams with the message
+        for term_id, shared in sorted(hits.items(), key=lambda kv: kv[1], reverse=True)[:20]:
+            term, idx, kind = self.terms[term_id]
+            if shared < len(_trigrams(term)) * 0.4:
+                continue
+            similarity = self._best_window_similarity(term, words)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                score = round(similarity * FUZZY_WEIGHT * TERM_WEIGHTS[kind], 3)
+                results.append((idx, ProjectMatch(self.projects[idx], score, term, "fuzzy")))
+        return results
+
+    @staticmethod
+    def _best_window_similarity(term, words):
+        """Best similarity between the term and any run of message words of similar length"""
+        size = len(term.split())
+        best = 0.0
+        for width in {max(1, size - 1), size, size + 1}:
+            for start in range(0, max(1, len(words) - width + 1)):
+                window = " ".join(words[start:start + width])
+                best = max(best, SequenceMatcher(None, term, window).ratio())
+        return best
+
+
+def confident_match(matches):
+    """The top candidate of match() if it is confident enough, else None"""
+    if matches and matches[0].score >= PROJECT_MATCH_THRESHOLD:
+        return matches[0]
+    return None
+
+
+_matcher_cache = {"version": None, "matcher": None}
+_matcher_lock = threading.Lock()
+
+
+def get_matcher(projects, version):
+    """ProjectMatcher for this catalog version, compiled on first use"""
+    with _matcher_lock:
+        if _matcher_cache["matcher"] is None or _matcher_cache["version"] != version:
+            _matcher_cache["matcher"] = ProjectMatcher(projects)
+            _matcher_cache["version"] = version
+        return _matcher_cache["matcher"]
@@ -0,0 +1,137 @@
+# project_models.py
+"""
+Typed, compact records for the project catalog.
+
+tools.get_projects hands these out directly, so the chat path works on plain
+attributes and only turns the catalog into JSON when rendering the prompt.
+"""
+from dataclasses import dataclass, field
+import json
+
+IMAGE_BASE_URL = "https://www.amoghbuildtech.com/api/images"
+PROJECT_BASE_URL = "https://www.amoghbuildtech.com/projects"
+
+
+@dataclass(slots=True, frozen=True)
+class FloorPlan:
+    type: str
+    url: str
+
+    def to_dict(self):
+        return {"type": self.type, "url": self.url}
+
+
+@dataclass(slots=True, frozen=True)
+class Project:
+    id: str
+    name: str
+    slug: str = ""
+    link: str = ""
+    location: str = ""
+    price_range: str = None
+    configurations: tuple = ()
+    possession: str = None
+    size: object = "N/A"
+    images: tuple = ()
+    floor_plans: tuple = ()
+    site_plans: tuple = ()
+    site_maps: tuple = ()
+    amenities: tuple = ()
+    key_features: tuple = ()
+    highlights: tuple = ()
+    rera_id: str = "N/A"
+    status: str = "N/A"
+    towers: object = "N/A"
+    units: object = "N/A"
+    floors: tuple = ()
+    total_area: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_api(cls, p):
+        """Build a Project from a raw catalog API record"""
+        typebhk = p.get("typebhk") or []
+        slug = p.get("slug") or ""
+
+        return cls(
+            id=p.get("_id"),
+            name=p.get("name"),
+            slug=slug,
+            link=f"{PROJECT_BASE_URL}/{slug}",
+            location=f"{p.get('city')}, Sector {slug.split('-')[-2] if '-' in slug else 'N/A'}",
+            price_range=p.get("price"),
+            configurations=tuple(b.get("bhktype") for b in typebhk),
+            possession=p.get("possession"),
+            size=p.get("projectarea", "N/A"),
+            # Direct API URLs without Next.js image optimization, up to 8 images
+            images=tuple(f"{IMAGE_BASE_URL}/{img}" for img in (p.get("bannerimg") or [])[:8] if img),
+            floor_plans=tuple(
+                FloorPlan(type=fp.get("bhktype"), url=f"{IMAGE_BASE_URL}/{fp['img']}")
+                for fp in typebhk if fp.get("img")
+            ),
+            site_plans=tuple(f"{IMAGE_BASE_URL}/{sp}" for sp in (p.get("sitePlan") or []) if sp),
+            site_maps=tuple(f"{IMAGE_BASE_URL}/{sm}" for sm in (p.get("siteMap") or []) if sm),
+            amenities=tuple((p.get("amenities") or [])[:20]),  # First 20 amenities IDs
+            key_features=tuple(p.get("keyfeatures") or []),
+            highlights=tuple(p.get("highlight") or []),
+            rera_id=p.get("reraId", "N/A"),
+            status=p.get("status", "N/A"),
+            towers=p.get("towers", "N/A"),
+            units=p.get("units", "N/A"),
+            floors=tuple(p.get("floors") or []),
+            total_area=p.get("totalProjectArea") or {},
+        )
+
+    @classmethod
+    def from_dict(cls, d):
+        """Inverse of to_dict (used for the on-disk snapshot)"""
+        values = dict(d)
+        values["floor_plans"] = tuple(FloorPlan(**fp) for fp in d.get("floor_plans") or [])
+        for name in ("configurations", "images", "site_plans", "site_maps", "amenities",
+                     "key_features", "highlights", "floors"):
+            values[name] = tuple(d.get(name) or [])
+        values["total_area"] = d.get("total_area") or {}
+        return cls(**{f: values[f] for f in cls.__dataclass_fields__ if f in values})
+
+    def to_summary(self):
+        """The few fields needed to list a project in the prompt"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "location": self.location,
+            "price_range": self.price_range,
+            "configurations": list(self.configurations),
+            "possession": self.possession,
+            "link": self.link,
+        }
+
+    def to_dict(self):
+        """Plain JSON-serialisable dict with the original field names"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "slug": self.slug,
+            "link": self.link,
+            "location": self.location,
+            "price_range": self.price_range,
+            "configurations": list(self.configurations),
+            "possession": self.possession,
+            "size": self.size,
+            "images": list(self.images),
+            "floor_plans": [fp.to_dict() for fp in self.floor_plans],
+            "site_plans": list(self.site_plans),
+            "site_maps": list(self.site_maps),
+            "amenities": list(self.amenities),
+            "key_features": list(self.key_features),
+            "highlights": list(self.highlights),
+            "rera_id": self.rera_id,
+            "status": self.status,
+            "towers": self.towers,
+            "units": self.units,
+            "floors": list(self.floors),
+            "total_area": self.total_area,
+        }
+
+
+def render_projects_json(projects, indent=2):
+    """Render projects as JSON for the system prompt"""
+    return json.dumps([p.to_dict() for p in projects], indent=indent, ensure_ascii=False)
@@ -0,0 +1,157 @@
+# project_retrieval.py
+"""
+Pick the catalog projects worth putting in full into the prompt.
+
+Every project is still listed as a one-line summary, but images, floor plans,
+amenities and the rest are only included for the top-k projects that match
+the current lead state and message.
+"""
+from functools import lru_cache
+import json
+import os
+import re
+
+from project_matcher import get_matcher
+from project_models import render_projects_json
+
+PROMPT_TOP_K = int(os.environ.get("PROMPT_TOP_K", "3"))
+
+_AMOUNT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(cr|crore|crores|l|lac|lacs|lakh|lakhs)?\b", re.IGNORECASE)
+_RANGE_SEP_RE = re.compile(r"^\s*(?:-|–|to)\s*₹?\s*$", re.IGNORECASE)
+_BHK_RE = re.compile(r"(\d+)\s*\+?\s*bhk", re.IGNORECASE)
+_SECTOR_RE = re.compile(r"sector\s*-?\s*(\d+)", re.IGNORECASE)
+
+
+def _to_lakhs(value, unit):
+    unit = (unit or "").lower()
+    if unit.startswith("c"):
+        return value * 100
+    return value
+
+
+def parse_amounts(text):
+    """All money amounts in a string, in lakhs ('₹50L - ₹1 Cr' -> [50, 100])"""
+    amounts = []
+    text = (text or "").replace(",", "")
+    matches = list(_AMOUNT_RE.finditer(text))
+    for i, m in enumerate(matches):
+        unit = m.group(2)
+        if not unit and i + 1 < len(matches):
+            # '1.2 - 1.8 Cr': a bare number takes the unit of the amount it ranges to
+            nxt = matches[i + 1]
+            if nxt.group(2) and _RANGE_SEP_RE.match(text[m.end():nxt.start()]):
+                unit = nxt.group(2)
+        if unit:
+            amounts.append(_to_lakhs(float(m.group(1)), unit))
+    return amounts
+
+
+def parse_budget(text):
+    """Budget answer -> (min_lakhs, max_lakhs); either bound may be None"""
+    amounts = parse_amounts(text)
+    if not amounts:
+        return None
+    lowered = text.lower()
+    if "under" in lowered or "below" in lowered or "upto" in lowered or "up to" in lowered:
+        return (None, amounts[0])
+    if "above" in lowered or "over" in lowered or "more than" in lowered:
+        return (amounts[0], None)
+    if len(amounts) >= 2:
+        return (min(amounts), max(amounts))
+    # A single figure: allow some room either way
+    return (amounts[0] * 0.8, amounts[0] * 1.2)
+
+
+def parse_bhk(text):
+    """Requested configurations as a set of ints (5 stands for '4+'), plus 0 for studio"""
+    wanted = set()
+    for m in _BHK_RE.finditer(text or ""):
+        n = int(m.group(1))
+        wanted.update(range(n, 6) if "+" in m.group(0) else {n})
+    if "studio" in (text or "").lower():
+        wanted.add(0)
+    return wanted
+
+
+@lru_cache(maxsize=4096)
+def _config_bhks(config):
+    return frozenset(parse_bhk(config or ""))
+
+
+@lru_cache(maxsize=4096)
+def _price_bounds(price_range):
+    prices = parse_amounts(price_range)
+    return (min(prices), max(prices)) if prices else None
+
+
+def build_query(lead_data, message):
+    """Everything retrieval needs from this turn, parsed once"""
+    requirements = lead_data.get("requirements") or {}
+    return {
+        "interested_project_id": lead_data.get("interested_project_id"),
+        "budget": parse_budget(f"{requirements.get('budget') or ''} {message}"),
+        "bhk": parse_bhk(f"{requirements.get('configuration') or ''} {message}"),
+        "sectors": set(_SECTOR_RE.findall(message or "")),
+        "ready": "ready" in f"{requirements.get('possession') or ''} {message}".lower(),
+    }
+
+
+def score_project(project, query, matched_scores):
+    """Relevance of one project to the parsed query"""
+    score = matched_scores.get(project.id, 0.0) * 3
+
+    if project.id and project.id == query["interested_project_id"]:
+        score += 3
+
+    if query["budget"]:
+        bounds = _price_bounds(str(project.price_range or ""))
+        low, high = query["budget"]
+        if bounds and (high is None or bounds[0] <= high) and (low is None or bounds[1] >= low):
+            score += 1
+
+    if query["bhk"] and any(query["bhk"] & _config_bhks(c) for c in project.configurations):
+        score += 1
+
+    if query["sectors"]:
+        project_sector = _SECTOR_RE.search(project.location or "")
+        if project_sector and project_sector.group(1) in query["sectors"]:
+            score += 1.5
+
+    if query["ready"] and "ready" in str(project.possession or "").lower():
+        score += 0.5
+
+    return score
+
+
+def select_relevant_projects(projects, lead_data, message, version=None, k=None, matches=None):
+    """The k projects most relevant to this turn, best first (may be fewer).
+
+    `matches` are the matcher candidates for the message, if the caller
+    already has them.
+    """
+    k = PROMPT_TOP_K if k is None else k
+    if not projects or k <= 0:
+        return []
+
+    query = build_query(lead_data, message)
+    if matches is None:
+        matches = get_matcher(projects, version).match(message)
+    matched_scores = {m.project.id: m.score for m in matches}
+    scored = [(score_project(p, query, matched_scores), i, p) for i, p in enumerate(projects)]
+    scored = [s for s in scored if s[0] > 0]
+    scored.sort(key=lambda s: (-s[0], s[1]))
+    return [p for _, _, p in scored[:k]]
+
+
+def render_catalog_summary(projects):
+    """One compact JSON line per project"""
+    if not projects:
+        return "No projects available right now."
+    return "\n".join(json.dumps(p.to_summary(), ensure_ascii=False) for p in projects)
+
+
+def render_project_details(projects):
+    """Full JSON detail for the selected projects"""
+    if not projects:
+        return "No specific project selected yet. Use the summaries above, and ask about the customer's requirements to narrow down."
+    return render_projects_json(projects)
@@ -0,0 +1,270 @@
+# rate_limit.py
+"""
+Rate limiting and admission control for the chat endpoints.
+
+Token buckets cap how fast one client can spend model calls or OTPs:
+- per client IP and per session on /chat
+- per phone number on send_otp
+A limit is "capacity/seconds": a burst of `capacity` requests, refilled at
+capacity/seconds tokens per second. Buckets live in process memory, or in
+Redis with RATE_LIMIT_STORE=redis so all workers share them. If the shared
+store is unreachable requests are let through rather than failing the chat.
+
+Admission control caps the model calls in flight. Past the cap a bounded
+number of requests may wait for a slot; beyond that they are answered at
+once with BUSY_RESPONSE instead of queueing behind everyone else.
+"""
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import time
+
+from resp_client import RespClient
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+CHAT_RATE_PER_IP = os.environ.get("CHAT_RATE_PER_IP", "30/60")
+CHAT_RATE_PER_SESSION = os.environ.get("CHAT_RATE_PER_SESSION", "10/60")
+OTP_RATE_PER_PHONE = os.environ.get("OTP_RATE_PER_PHONE", "3/600")
+
+# Reverse proxies in front of the app (Render adds one); the client IP is the
+# X-Forwarded-For entry this many hops from the end
+RATE_LIMIT_PROXY_HOPS = int(os.environ.get("RATE_LIMIT_PROXY_HOPS", "1"))
+
+# Model calls allowed in flight at once, and how many more may wait for a slot
+CHAT_MAX_IN_FLIGHT = int(os.environ.get("CHAT_MAX_IN_FLIGHT", "100"))
+CHAT_MAX_QUEUE = int(os.environ.get("CHAT_MAX_QUEUE", "200"))
+# Longest a queued request waits before it is turned away
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "10"))
+
+BUSY_RESPONSE = {
+    "blocks": [{
+        "component": "Text",
+        "props": {
+            "text": "We're helping a lot of visitors right now. Please try again in a moment or call **+91 92500-94500**."
+        }
+    }]
+}
+
+RATE_LIMITED_RESPONSE = {
+    "blocks": [{
+        "component": "Text",
+        "props": {
+            "text": "You're sending messages a little too quickly. Please wait a few seconds and try again, or call **+91 92500-94500**."
+        }
+    }]
+}
+
+
+def parse_rate(rate):
+    """"30/60" -> (capacity 30, refill 0.5 tokens per second)"""
+    capacity, seconds = rate.split("/")
+    capacity = float(capacity)
+    return capacity, capacity / float(seconds)
+
+
+# =========================
+# BUCKET STORES
+# =========================
+class InMemoryBucketStore:
+    """Buckets in a dict, for one worker; idle buckets are evicted LRU-first"""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            # A bucket evicted early just starts full again, so evicting the
+            # least recently used keeps memory bounded under scraper traffic
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after == 0.0, retry_after
+
+
+# Refill, take and store atomically on the server
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RespBucketStore:
+    """Buckets in Redis, shared by every worker; keys expire once refilled"""
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate, cost=1):
+        retry_after = float(self.client.execute(
+            "EVAL", _TOKEN_BUCKET_SCRIPT, 1, f"{self.prefix}{key}", capacity, rate, time.time(), cost
+        ))
+        return retry_after == 0.0, retry_after
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Process-wide bucket store selected by RATE_LIMIT_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if RATE_LIMIT_STORE == "redis":
+                _store = RespBucketStore(RespClient.from_url(RATE_LIMIT_REDIS_URL))
+                print(f"🗄️ Using Redis rate limit store ({RATE_LIMIT_REDIS_URL})")
+            else:
+                _store = InMemoryBucketStore()
+        return _store
+
+
+class RateLimiter:
+    def __init__(self, name, rate, store=None):
+        self.name = name
+        self.capacity, self.refill = parse_rate(rate)
+        self._store = store
+
+    def check(self, key, cost=1):
+        """(allowed, seconds until allowed) for one request by `key`"""
+        if not RATE_LIMIT_ENABLED or not key:
+            return True, 0.0
+        store = self._store or get_bucket_store()
+        try:
+            allowed, retry_after = store.take(f"{self.name}:{key}", self.capacity, self.refill, cost)
+        except Exception as e:
+            print(f"⚠️ Rate limit store error ({e}), allowing request")
+            return True, 0.0
+        if not allowed:
+            print(f"🚦 Rate limited {self.name} {key} (retry in {retry_after:.1f}s)")
+        return allowed, retry_after
+
+
+chat_ip_limiter = RateLimiter("chat-ip", CHAT_RATE_PER_IP)
+chat_session_limiter = RateLimiter("chat-session", CHAT_RATE_PER_SESSION)
+otp_phone_limiter = RateLimiter("otp-phone", OTP_RATE_PER_PHONE)
+
+
+def client_ip(remote_addr, forwarded_for=None, hops=RATE_LIMIT_PROXY_HOPS):
+    """Client address as seen by the last trusted proxy"""
+    if hops and forwarded_for:
+        chain = [part.strip() for part in forwarded_for.split(",") if part.strip()]
+        if chain:
+            return chain[-min(hops, len(chain))]
+    return remote_addr
+
+
+def check_chat_rate(ip, session_id):
+    """Seconds the caller must wait before chatting again, or 0 if allowed"""
+    retry_after = 0.0
+    for limiter, key in ((chat_ip_limiter, ip), (chat_session_limiter, session_id)):
+        allowed, wait = limiter.check(key)
+        if not allowed:
+            retry_after = max(retry_after, wait)
+    return retry_after
+
+
+# =========================
+# ADMISSION CONTROL
+# =========================
+class AdmissionController:
+    """In-flight cap with a bounded wait queue, for threaded servers"""
+
+    def __init__(self, max_in_flight=CHAT_MAX_IN_FLIGHT, max_queue=CHAT_MAX_QUEUE, queue_timeout=CHAT_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting if allowed to; False means answer with BUSY_RESPONSE"""
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                # Shed load instead of letting the queue grow without bound
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    print(f"🚦 Chat queue full ({self.waiting} waiting), rejecting request")
+                    return False
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self.in_flight < self.max_in_flight, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    print("🚦 Timed out waiting for a chat slot, rejecting request")
+                    return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class AsyncAdmissionController:
+    """Same policy as AdmissionController, for one asyncio event loop"""
+
+    def __init__(self, max_in_flight=CHAT_MAX_IN_FLIGHT, max_queue=CHAT_MAX_QUEUE, queue_timeout=CHAT_QUEUE_TIMEOUT):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def acquire(self):
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            print(f"🚦 Chat queue full ({self.waiting} waiting), rejecting request")
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            print("🚦 Timed out waiting for a chat slot, rejecting request")
+            return False
+        finally:
+            self.waiting -= 1
+        return True
+
+    def release(self):
+        self._slots.release()
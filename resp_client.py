@@ -0,0 +1,159 @@
+# resp_client.py
+"""
+Minimal client for the Redis serialization protocol (RESP2).
+
+Enough for small key/value stores (OTPs, rate limit buckets) without
+adding a redis dependency. Works with Redis, Valkey, KeyDB or any server
+speaking RESP. Connections are pooled and reused; a connection that hits
+an I/O error is dropped instead of being put back.
+"""
+from collections import deque
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Error reply from the server (e.g. WRONGTYPE, NOAUTH)"""
+
+
+class RespClient:
+    def __init__(self, host="localhost", port=6379, db=0, password=None, username=None,
+                 timeout=2.0, max_idle=10):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """redis://[[user]:password@]host[:port][/db]"""
+        parsed = urlparse(url)
+        db = parsed.path.lstrip("/")
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=parsed.password,
+            username=parsed.username or None,
+            **kwargs
+        )
+
+    # ---- connections ----
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _Connection(sock)
+        if self.password:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            conn.call(auth)
+        if self.db:
+            conn.call(("SELECT", self.db))
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    # ---- commands ----
+
+    def execute(self, *args):
+        """Run one command and return its reply (raises RespError on an error reply)"""
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, commands):
+        """Send several commands in one round trip; returns their replies in order.
+
+        Error replies are returned as RespError instances, not raised, so one
+        failed command does not hide the others' results.
+        """
+        conn = self._acquire()
+        try:
+            replies = conn.call_many(commands)
+        except Exception:
+            # The reply stream may be out of step; never reuse this connection
+            conn.close()
+            raise
+        self._release(conn)
+        return replies
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def call(self, command):
+        reply = self.call_many([command])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def call_many(self, commands):
+        self.sock.sendall(b"".join(_encode(command) for command in commands))
+        return [self._read() for _ in commands]
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by server")
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._read() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+
+def _encode(command):
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
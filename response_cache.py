@@ -0,0 +1,196 @@
+# response_cache.py
+"""
+Cache of model answers to FAQ-style questions.
+
+Visitors keep asking the same few things: the office address, the phone
+number, "show me images of X", "what's the price of X". Each message is
+normalized (lowercase, no punctuation or filler words, synonyms mapped to
+one spelling, the named project replaced by "project"), and only a message
+whose whole normalized text is one of FAQ_QUERIES is cached. The answer is
+keyed by that text, the project, the catalog version and the lead fields
+that change the answer, so the next visitor asking the same thing skips
+the model call.
+
+Anything else is never cached: "is the price negotiable" normalizes to
+"price negotiable", which is not an FAQ query. An answer that contains the
+visitor's name or phone is never stored. All entries are dropped when the catalog
+changes. The LRU is bounded by entry count and total size.
+"""
+from collections import OrderedDict
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from project_matcher import normalize_text
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+
+# Words that don't change what is being asked
+_FILLER_WORDS = {
+    "a", "an", "the", "me", "my", "you", "your", "please", "pls", "plz", "can", "could",
+    "would", "will", "i", "we", "to", "of", "for", "about", "tell", "show", "share",
+    "send", "give", "know", "want", "what", "whats", "s", "is", "are", "do", "does",
+    "some", "any", "hi", "hello", "kindly", "get", "see", "let",
+}
+
+# Words asking the same thing, mapped to one spelling
+FAQ_SYNONYMS = {
+    "image": "images", "photo": "images", "photos": "images", "picture": "images",
+    "pictures": "images", "pic": "images", "pics": "images", "gallery": "images",
+    "prices": "price", "pricing": "price", "cost": "price", "costs": "price",
+    "mobile": "phone", "mail": "email",
+}
+
+# Normalized questions with one answer for everyone; "project" stands for
+# the project the message names
+FAQ_QUERIES = frozenset([
+    "images project", "project images",
+    "price project", "project price",
+    "address", "office address", "where office", "where office located",
+    "contact", "contact number", "contact details", "phone number", "office phone number",
+    "email", "email address", "email id",
+])
+
+# A word, keeping combining marks (e.g. Hindi vowel signs) inside it
+_MARKS = "".join(chr(c) for c in range(0x300, 0x2000) if unicodedata.category(chr(c)).startswith("M"))
+_WORD_RE = re.compile(f"(?:[^\\W_]|[{_MARKS}])+")
+
+
+def normalize_query(message, project_term=None):
+    """Lowercase, strip punctuation and filler words, map synonyms.
+
+    project_term is the (normalized) name the matcher found in the message;
+    it becomes "project", so the same question about any project has one
+    form. Returns None if the term is not literally in the message.
+    """
+    text = normalize_text(message)
+    if project_term:
+        padded = f" {text} "
+        if f" {project_term} " not in padded:
+            return None
+        text = padded.replace(f" {project_term} ", " project ")
+    return " ".join(FAQ_SYNONYMS.get(w, w) for w in text.split() if w not in _FILLER_WORDS)
+
+
+def faq_query(message, project_term=None):
+    """Normalized form of an FAQ question, or None if the message is not one"""
+    # Digits mean a phone number or OTP, i.e. lead capture, not a question
+    if any(ch.isdigit() for ch in message):
+        return None
+    query = normalize_query(message, project_term)
+    if query not in FAQ_QUERIES:
+        return None
+    # "project" must be the project the matcher found, not the word itself
+    if ("project" in query.split()) != bool(project_term):
+        return None
+    return query
+
+
+def cache_key(query, project_id, catalog_version, stage, lead_data):
+    """Key of an FAQ answer: the question, the catalog, and the lead fields the answer depends on"""
+    return (
+        query,
+        project_id,
+        catalog_version,
+        stage,
+        lead_data["customer_type"],
+        bool(lead_data["name"]),
+        bool(lead_data["phone_verified"]),
+    )
+
+
+def mentions_visitor(reply, lead_data):
+    """True if the reply contains details of this visitor, which must not be shared"""
+    if lead_data["phone"] and lead_data["phone"] in reply:
+        return True
+    # "Sure Rahul" gives away "Rahul Sharma" too, so check each part of the name
+    words = set(_WORD_RE.findall(reply.lower()))
+    return any(len(part) > 1 and part in words for part in _WORD_RE.findall((lead_data["name"] or "").lower()))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (reply, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, reply):
+        size = len(reply)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (reply, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *args):
+        """Drop every entry (registered as a catalog change listener)"""
+        with self._lock:
+            if self._entries:
+                print(f"🧹 Catalog changed, dropping {len(self._entries)} cached answer(s)")
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _drop(self, key):
+        reply, _ = self._entries.pop(key)
+        self._bytes -= len(reply)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def get_response_cache_stats():
+    return get_response_cache().stats()
@@ -0,0 +1,272 @@
+# session_store.py
+"""
+Per-visitor conversation state (stage, lead data, history), keyed by session id.
+
+Two backends:
+- InMemorySessionStore: LRU with a size cap and idle TTL, for a single worker
+- SqliteSessionStore: shared file, for several gunicorn workers on one host
+
+Pick one with SESSION_STORE=memory|sqlite (default memory).
+"""
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_DB_FILE = os.environ.get("SESSION_DB_FILE", "sessions.db")
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "10000"))
+SESSION_IDLE_TTL = int(os.environ.get("SESSION_IDLE_TTL", str(6 * 60 * 60)))
+
+
+def new_session_id():
+    return str(uuid.uuid4())
+
+
+class LeadRecord:
+    """Lead state of one session.
+
+    Slotted to keep thousands of live sessions small, but supports the dict
+    style access (lead_data["name"], lead_data.get(...)) used across the code.
+    """
+    __slots__ = (
+        "customer_type",            # "existing" or "new"
+        "name",
+        "phone",
+        "phone_verified",
+        "otp_sent",
+        "interested_project_id",
+        "interested_project_name",
+        "lead_submitted",
+        "conversation_remarks",
+        "requirements",
+    )
+
+    def __init__(self):
+        self.customer_type = None
+        self.name = None
+        self.phone = None
+        self.phone_verified = False
+        self.otp_sent = False
+        self.interested_project_id = None
+        self.interested_project_name = None
+        self.lead_submitted = False
+        self.conversation_remarks = []
+        self.requirements = {
+            "purpose": None,
+            "budget": None,
+            "possession": None,
+            "configuration": None
+        }
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in self.__slots__}
+        data["conversation_remarks"] = list(self.conversation_remarks)
+        data["requirements"] = dict(self.requirements)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        lead = cls()
+        for key, value in (data or {}).items():
+            if key in cls.__slots__:
+                setattr(lead, key, value)
+        return lead
+
+
+class Session:
+    """Everything run_conversation needs for one visitor"""
+    __slots__ = ("session_id", "stage", "lead", "history", "folded_turns", "created_at", "last_seen")
+
+    def __init__(self, session_id, stage="INITIAL", lead=None, history=None, folded_turns=0,
+                 created_at=None, last_seen=None):
+        now = time.time()
+        self.session_id = session_id
+        self.stage = stage
+        self.lead = lead if lead is not None else LeadRecord()
+        self.history = history if history is not None else []
+        self.folded_turns = folded_turns  # old turns replaced by the summary
+        self.created_at = created_at or now
+        self.last_seen = last_seen or now
+
+
+class InMemorySessionStore:
+    """LRU of live sessions with a size cap and idle expiry"""
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the session, creating a fresh one if missing or expired"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.last_seen > self.idle_ttl:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                self._evict(now)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session):
+        session.last_seen = time.time()
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._evict(session.last_seen)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self, now):
+        # Oldest entries sit at the front: drop idle ones, then trim to size
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - oldest.last_seen > self.idle_ttl:
+                del self._sessions[oldest_id]
+            else:
+                break
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SqliteSessionStore:
+    """Sessions in a SQLite file shared by all workers on the host"""
+
+    def __init__(self, path=SESSION_DB_FILE, idle_ttl=SESSION_IDLE_TTL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                lead TEXT NOT NULL,
+                history TEXT NOT NULL,
+                folded_turns INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "folded_turns" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN folded_turns INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions(last_seen)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT stage, lead, history, folded_turns, created_at, last_seen FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None or now - row[5] > self.idle_ttl:
+            return Session(session_id)
+        stage, lead, history, folded_turns, created_at, last_seen = row
+        return Session(
+            session_id,
+            stage=stage,
+            lead=LeadRecord.from_dict(json.loads(lead)),
+            history=json.loads(history),
+            folded_turns=folded_turns,
+            created_at=created_at,
+            last_seen=last_seen
+        )
+
+    def save(self, session):
+        session.last_seen = time.time()
+        conn = self._conn()
+        conn.execute(
+            """INSERT INTO sessions (session_id, stage, lead, history, folded_turns, created_at, last_seen)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(session_id) DO UPDATE SET
+                   stage = excluded.stage,
+                   lead = excluded.lead,
+                   history = excluded.history,
+                   folded_turns = excluded.folded_turns,
+                   last_seen = excluded.last_seen""",
+            (
+                session.session_id,
+                session.stage,
+                json.dumps(session.lead.to_dict()),
+                json.dumps(session.history),
+                session.folded_turns,
+                session.created_at,
+                session.last_seen,
+            )
+        )
+        conn.commit()
+        self._maybe_sweep(session.last_seen)
+
+    def delete(self, session_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def _maybe_sweep(self, now):
+        """Drop idle sessions, at most once a minute"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - self.idle_ttl,))
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide store selected by SESSION_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE == "sqlite":
+                _store = SqliteSessionStore()
+                print(f"🗄️ Using SQLite session store ({SESSION_DB_FILE})")
+            else:
+                _store = InMemorySessionStore()
+        return _store
@@ -0,0 +1,292 @@
+# stage_machine.py
+"""
+Lead-capture stages and the transitions between them.
+
+The flow is a table of transitions, checked and indexed by source stage
+once at import. Each turn the visitor's message is normalized once into a
+Message. The first transition out of the current stage whose guard accepts
+the message then runs its action. The guard extracts what the transition
+needs (customer type, name, phone, OTP) and the action stores it on the
+lead and returns the next stage, which must be one of the transition's
+declared targets.
+
+At most one transition fires per turn. For example, the option click that
+picks the customer type is never also read as a name. The table is checked
+at import: sources and targets must be known stages, and every stage must
+be reachable from INITIAL.
+"""
+from collections import namedtuple, deque
+import re
+import unicodedata
+
+from tools import send_otp, verify_otp
+
+STAGES = (
+    "INITIAL",
+    "CUSTOMER_TYPE_SELECTED",
+    "NAME_COLLECTED",
+    "PHONE_COLLECTED",   # phone known, OTP could not be sent yet
+    "PHONE_INVALID",
+    "OTP_SENT",
+    "OTP_INVALID",
+    "VERIFIED",
+)
+START_STAGE = "INITIAL"
+
+_DIGITS_RE = re.compile(r"\d+")
+_EXISTING_CUSTOMER_WORDS = ("existing", "already", "client")
+_NEW_CUSTOMER_WORDS = ("new", "guest", "first time")
+# A letter in any script; combining marks (accents, Hindi vowel signs) count too
+_MARKS = "".join(chr(c) for c in range(0x300, 0x2000) if unicodedata.category(chr(c)).startswith("M"))
+_LETTER = f"(?:[^\\W\\d_]|[{_MARKS}])"
+_NAME_PHRASE_RE = re.compile(rf"\b(?:my name is|i am|i'm|this is) ({_LETTER}+(?:\s+{_LETTER}+)?)", re.IGNORECASE)
+# Messages that are questions or requests, not someone saying their name
+_NOT_A_NAME_RE = re.compile(
+    r"\b(what|where|when|how|why|which|who|show|send|price|cost|image|photo|picture|project|"
+    r"bhk|flat|plot|office|address|interest|look|want|need|budget|call|number)(s|es|ed|ing)?\b", re.IGNORECASE
+)
+_NAME_RE = re.compile(rf"{_LETTER}(?:{_LETTER}|[.'\- ])*")
+_OTP_RE = re.compile(r"\b\d{4,6}\b")
+
+_NAME_FILLER_WORDS = frozenset(
+    ['hi', 'hello', 'yes', 'no', 'okay', 'sure', 'my', 'name', 'is', 'i', 'am', "i'm", 'im', 'the', 'this', "it's", 'its']
+)
+_MAX_NAME_WORDS = 4
+
+# Requirement answers, matched on the lowercased message. A keyword is a
+# substring, or (substring, pattern) for ambiguous ones: substring checks are
+# far cheaper than a regex scan, so the pattern only runs to confirm a hit.
+REQUIREMENT_KEYWORDS = (
+    ("purpose", ("residential", "investment", "commercial")),
+    ("budget", ("lakh", "crore", ("cr", re.compile(r"(?<![a-z])cr\b")))),
+    ("possession", ("ready", "year")),
+    ("configuration", ("bhk", "studio")),
+)
+
+
+class Message:
+    """The user's message, normalized once per turn"""
+    __slots__ = ("text", "lower", "_digits")
+
+    def __init__(self, text):
+        self.text = (text or "").strip()
+        self.lower = self.text.lower()
+        self._digits = None
+
+    @property
+    def digits(self):
+        """All digits of the message, computed on first use"""
+        if self._digits is None:
+            self._digits = "".join(_DIGITS_RE.findall(self.text))
+        return self._digits
+
+
+def _contains_any(text, keywords):
+    for keyword in keywords:
+        if isinstance(keyword, tuple):
+            if keyword[0] in text and keyword[1].search(text):
+                return True
+        elif keyword in text:
+            return True
+    return False
+
+
+# =========================
+# EXTRACTORS
+# =========================
+def extract_customer_type(message):
+    """"existing" or "new" if the visitor picked a customer type"""
+    if _contains_any(message.lower, _EXISTING_CUSTOMER_WORDS):
+        return "existing"
+    if _contains_any(message.lower, _NEW_CUSTOMER_WORDS):
+        return "new"
+    return None
+
+
+def _could_be_name(message):
+    return bool(message.text) and not message.digits and "?" not in message.text \
+        and not _NOT_A_NAME_RE.search(message.text)
+
+
+def extract_stated_name(message):
+    """Name given explicitly ("my name is ...", "I'm ..."), or None"""
+    if not _could_be_name(message):
+        return None
+    match = _NAME_PHRASE_RE.search(message.text)
+    return match.group(1).title() if match else None
+
+
+def extract_name(message):
+    """Name from a reply to "may I have your good name?", or None"""
+    if not _could_be_name(message):
+        return None
+
+    match = _NAME_PHRASE_RE.search(message.text)
+    if match:
+        return match.group(1).title()
+
+    words = [w for w in message.text.split() if w.lower() not in _NAME_FILLER_WORDS]
+    name = " ".join(words)
+    if len(name) > 1 and len(words) <= _MAX_NAME_WORDS and _NAME_RE.fullmatch(name):
+        return name.title()
+    return None
+
+
+def extract_phone(message):
+    """10-digit mobile number, without +91 or a leading 0, or None"""
+    digits = message.digits
+    if digits.startswith('91') and len(digits) > 10:
+        digits = digits[2:]
+    if digits.startswith('0') and len(digits) > 10:
+        digits = digits[1:]
+    return digits if len(digits) == 10 else None
+
+
+def extract_otp(message):
+    if not message.digits:
+        return None
+    match = _OTP_RE.search(message.text)
+    return match.group() if match else None
+
+
+def capture_requirements(message, lead):
+    """Store requirement answers (purpose, budget, ...) found in the message"""
+    lower = message.lower
+    for key, keywords in REQUIREMENT_KEYWORDS:
+        if _contains_any(lower, keywords):
+            lead["requirements"][key] = message.text
+
+
+# =========================
+# GUARDS & ACTIONS
+# =========================
+def _name_guard(message, lead):
+    """Only new guests are asked for their name; an existing client's free
+    text is a request, so for them only an explicit "my name is ..." counts"""
+    if lead["name"]:
+        return None
+    if lead["customer_type"] == "new":
+        return extract_name(message)
+    return extract_stated_name(message)
+
+
+def _partial_phone_guard(message, lead):
+    """A number typed wrong: mostly digits, but not a valid phone.
+
+    "Sector 102 3BHK" or "2 bhk under 1.5 cr" have digits too; those are
+    requirements, not phone attempts, and leave the stage unchanged.
+    """
+    digits = message.digits
+    if len(digits) < 4 or len(digits) * 2 <= len(message.text) - message.text.count(" "):
+        return False
+    if any(_contains_any(message.lower, keywords) for _, keywords in REQUIREMENT_KEYWORDS):
+        return False
+    return extract_phone(message) is None
+
+
+def _select_customer_type(message, lead, customer_type):
+    lead["customer_type"] = customer_type
+    return "CUSTOMER_TYPE_SELECTED"
+
+
+def _capture_name(message, lead, name):
+    lead["name"] = name
+    lead["conversation_remarks"].append(f"Name: {name}")
+    print(f"✅ Name captured: {name}")
+    return "NAME_COLLECTED"
+
+
+def _capture_phone(message, lead, phone):
+    if phone != lead["phone"]:
+        lead["phone"] = phone
+        lead["phone_verified"] = False
+        lead["conversation_remarks"].append(f"Phone: {phone}")
+        print(f"✅ Phone captured: {phone}")
+
+    otp_result = send_otp(phone)
+    if otp_result.get("status") == "success":
+        lead["otp_sent"] = True
+        return "OTP_SENT"
+    return "PHONE_COLLECTED"
+
+
+def _reject_phone(message, lead, _):
+    print(f"❌ Invalid phone: {message.digits} (length: {len(message.digits)})")
+    return "PHONE_INVALID"
+
+
+def _check_otp(message, lead, otp):
+    verify_result = verify_otp(lead["phone"], otp)
+    if verify_result.get("status") == "success":
+        lead["phone_verified"] = True
+        print(f"✅ Phone verified successfully")
+        return "VERIFIED"
+    return "OTP_INVALID"
+
+
+# =========================
+# TRANSITION TABLE
+# =========================
+Transition = namedtuple("Transition", ["name", "sources", "guard", "action", "targets"])
+
+# Checked in order; the first transition whose guard returns a value fires
+TRANSITIONS = (
+    Transition("customer_type", ("INITIAL",),
+               lambda message, lead: extract_customer_type(message), _select_customer_type,
+               ("CUSTOMER_TYPE_SELECTED",)),
+    Transition("name", ("CUSTOMER_TYPE_SELECTED",),
+               _name_guard, _capture_name,
+               ("NAME_COLLECTED",)),
+    # Also from the OTP stages: the OTP input lets the visitor edit the number
+    Transition("phone", ("NAME_COLLECTED", "PHONE_INVALID", "PHONE_COLLECTED", "OTP_SENT", "OTP_INVALID"),
+               lambda message, lead: extract_phone(message), _capture_phone,
+               ("OTP_SENT", "PHONE_COLLECTED")),
+    Transition("phone_invalid", ("NAME_COLLECTED", "PHONE_INVALID"),
+               _partial_phone_guard, _reject_phone,
+               ("PHONE_INVALID",)),
+    Transition("otp", ("OTP_SENT", "OTP_INVALID"),
+               lambda message, lead: lead["phone"] and extract_otp(message), _check_otp,
+               ("VERIFIED", "OTP_INVALID")),
+)
+
+
+def find_unreachable_stages(transitions=TRANSITIONS, stages=STAGES, start=START_STAGE):
+    """Stages no chain of transitions leads to from `start`"""
+    reachable = {start}
+    queue = deque([start])
+    while queue:
+        stage = queue.popleft()
+        for transition in transitions:
+            if stage in transition.sources:
+                for target in transition.targets:
+                    if target not in reachable:
+                        reachable.add(target)
+                        queue.append(target)
+    return [stage for stage in stages if stage not in reachable]
+
+
+def compile_transitions(transitions=TRANSITIONS, stages=STAGES, start=START_STAGE):
+    """Validate the table and index it by source stage"""
+    for transition in transitions:
+        unknown = [s for s in transition.sources + transition.targets if s not in stages]
+        if unknown:
+            raise ValueError(f"Transition {transition.name} uses unknown stage(s): {', '.join(unknown)}")
+    unreachable = find_unreachable_stages(transitions, stages, start)
+    if unreachable:
+        raise ValueError(f"Unreachable stage(s): {', '.join(unreachable)}")
+    return {stage: tuple(t for t in transitions if stage in t.sources) for stage in stages}
+
+
+_TRANSITIONS_BY_STAGE = compile_transitions()
+
+
+def advance(stage, message, lead):
+    """Fire the first transition out of `stage` that accepts the message; returns the new stage"""
+    for transition in _TRANSITIONS_BY_STAGE.get(stage, ()):
+        value = transition.guard(message, lead)
+        if value:
+            next_stage = transition.action(message, lead, value)
+            if next_stage not in transition.targets:
+                raise RuntimeError(f"Transition {transition.name} moved to undeclared stage {next_stage}")
+            return next_stage
+    return stage
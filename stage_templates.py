@@ -0,0 +1,127 @@
+# stage_templates.py
+"""
+Scripted replies for the fixed steps of the lead flow.
+
+system_prompt.py spells out the exact blocks for the welcome, the name and
+phone questions, the invalid phone and OTP inputs, and the four requirement
+questions. When a turn lands on one of those steps unambiguously, the reply
+is rendered here from the stage and lead data and the model is not called.
+Anything else (questions, project mentions, free text) still goes to the
+model. So does a name that was only guessed: "Gurgaon" in reply to the name
+question may be a name or not, and the model can tell better than a script.
+"""
+import json
+import os
+
+from stage_machine import Message, extract_stated_name
+
+SCRIPTED_REPLIES = os.environ.get("SCRIPTED_REPLIES", "1") == "1"
+
+# Requirement questions, asked in this order once the phone is verified
+REQUIREMENT_QUESTIONS = [
+    ("purpose", "What is your primary purpose?",
+     ["Residential (End Use)", "Investment", "Commercial Property"]),
+    ("budget", "What's your budget range?",
+     ["Under ₹50 Lakhs", "₹50L - ₹1 Cr", "₹1 Cr - ₹2 Cr", "Above ₹2 Cr"]),
+    ("possession", "When do you need possession?",
+     ["Ready to Move", "Within 1 Year", "1-2 Years", "2+ Years"]),
+    ("configuration", "What configuration are you looking for?",
+     ["1 BHK", "2 BHK", "3 BHK", "4+ BHK", "Studio Apartment"]),
+]
+
+REQUIREMENT_OPTIONS = {option for _, _, options in REQUIREMENT_QUESTIONS for option in options}
+
+
+def _text(text):
+    return {"component": "Text", "props": {"text": text}}
+
+
+def welcome_blocks(lead_data):
+    return [
+        _text("Welcome to **Amogh Buildtech**! 🏡\n\nI'm your personal real estate consultant. I'm here to help you find your perfect property.\n\nBefore we begin, please let me know:"),
+        {"component": "Options", "props": {"options": ["I'm an existing client", "I'm a new guest"]}},
+    ]
+
+
+def customer_type_blocks(lead_data):
+    if lead_data["customer_type"] == "existing":
+        return [_text("Welcome back! We're **delighted to serve you again**. 😊\n\nIt's wonderful to have you return. How can I assist you today?")]
+    return [_text("Welcome! Thank you for choosing **Amogh Buildtech**. We're excited to help you find your dream property.\n\nTo get started, may I have your **good name**?")]
+
+
+def phone_request_blocks(lead_data):
+    return [_text(f"Thank you, {lead_data['name']}! Please share your **WhatsApp number** (10 digits) so I can send you property details and updates.")]
+
+
+def phone_invalid_blocks(lead_data):
+    return [
+        _text("It looks like the number might be incomplete or incorrect. Please provide a valid **10-digit mobile number**."),
+        {"component": "PhoneInput", "props": {"currentPhone": lead_data["phone"] or "", "allowEdit": True}},
+    ]
+
+
+def otp_sent_blocks(lead_data):
+    phone = lead_data["phone"]
+    return [
+        _text(f"Perfect! I've sent a **verification code** to **+91 {phone}** via WhatsApp.\n\nPlease enter the OTP below:"),
+        {"component": "OTPInput", "props": {"phone": phone, "allowEdit": True, "resendAfter": 30}},
+    ]
+
+
+def next_requirement_block(lead_data):
+    """Options block for the first requirement not answered yet, or None"""
+    for key, question, options in REQUIREMENT_QUESTIONS:
+        if not lead_data["requirements"].get(key):
+            return {"component": "Options", "props": {"question": question, "options": options}}
+    return None
+
+
+def verified_blocks(lead_data):
+    question = next_requirement_block(lead_data)
+    if question is None:
+        return None
+    return [_text(f"Great! Now let's find the perfect property for you, {lead_data['name']}."), question]
+
+
+def _name_is_certain(lead_data, user_prompt):
+    """A new guest was asked for their name and stated it; anything else may be a guess"""
+    return lead_data["customer_type"] == "new" and extract_stated_name(Message(user_prompt)) is not None
+
+
+# Stage entered this turn -> reply
+STAGE_TEMPLATES = {
+    "CUSTOMER_TYPE_SELECTED": customer_type_blocks,
+    "NAME_COLLECTED": phone_request_blocks,
+    "PHONE_INVALID": phone_invalid_blocks,
+    "OTP_SENT": otp_sent_blocks,
+    "VERIFIED": verified_blocks,
+}
+
+# Stages whose transition can rest on a guess; scripted only when the check passes
+STAGE_CHECKS = {
+    "NAME_COLLECTED": _name_is_certain,
+}
+
+
+def render_scripted_reply(previous_stage, stage, lead_data, user_prompt, first_turn):
+    """JSON reply for a scripted step, or None if the model should answer"""
+    if not SCRIPTED_REPLIES or "?" in user_prompt:
+        return None
+
+    blocks = None
+    if stage != previous_stage:
+        template = STAGE_TEMPLATES.get(stage)
+        check = STAGE_CHECKS.get(stage)
+        if template and (check is None or check(lead_data, user_prompt)):
+            blocks = template(lead_data)
+    elif stage == "INITIAL" and first_turn:
+        blocks = welcome_blocks(lead_data)
+    elif stage == "VERIFIED" and user_prompt.strip() in REQUIREMENT_OPTIONS:
+        # An option click answers the last question; ask the next one
+        question = next_requirement_block(lead_data)
+        blocks = [question] if question else None
+
+    if not blocks:
+        return None
+    print(f"⚡ Scripted reply for stage {stage} (no model call)")
+    return json.dumps({"blocks": blocks})
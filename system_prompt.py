@@ -1,6 +1,7 @@
 # system_prompt.py
+from project_retrieval import render_catalog_summary, render_project_details
 
-SYSTEM_PROMPT = """
+STATIC_SYSTEM_PROMPT = """
 You are a professional real estate sales consultant at **Amogh Buildtech Private Limited**.
 
 **COMMUNICATION RULES:**
@@ -49,11 +50,9 @@ If user selects "I'm a new guest":
 ====================================================
 
 **Current Lead Status:**
-- Name: {name}
-- Phone: {phone}
-- Phone Verified: {phone_verified}
-- Interested Project: {project_name}
-- Lead Submitted: {lead_submitted}
+Sent as a separate "CURRENT LEAD STATUS" message at the end of the conversation.
+Always use the latest one. [Customer Name] and [Customer Phone] below refer to
+the name and phone in it.
 
 **NAME COLLECTION:**
 - Ask once: "May I have your **good name**?"
@@ -61,7 +60,7 @@ If user selects "I'm a new guest":
 - Never ask again
 
 **PHONE NUMBER COLLECTION:**
-- Ask: "Thank you, {name}! Please share your **WhatsApp number** (10 digits) so I can send you property details and updates."
+- Ask: "Thank you, [Customer Name]! Please share your **WhatsApp number** (10 digits) so I can send you property details and updates."
 - Must be exactly 10 digits
 - If invalid (<10 or >10 digits): 
 {{
@@ -75,7 +74,7 @@ If user selects "I'm a new guest":
     {{
       "component": "PhoneInput",
       "props": {{
-        "currentPhone": "{phone}",
+        "currentPhone": "[Customer Phone]",
         "allowEdit": true
       }}
     }}
@@ -89,13 +88,13 @@ After valid phone number collected:
     {{
       "component": "Text",
       "props": {{
-        "text": "Perfect! I've sent a **verification code** to **+91 {phone}** via WhatsApp.\\n\\nPlease enter the OTP below:"
+        "text": "Perfect! I've sent a **verification code** to **+91 [Customer Phone]** via WhatsApp.\\n\\nPlease enter the OTP below:"
       }}
     }},
     {{
       "component": "OTPInput",
       "props": {{
-        "phone": "{phone}",
+        "phone": "[Customer Phone]",
         "allowEdit": true,
         "resendAfter": 30
       }}
@@ -115,7 +114,7 @@ Once phone is verified, ask requirements using **multiple choice options**:
     {{
       "component": "Text",
       "props": {{
-        "text": "Great! Now let's find the perfect property for you, {name}."
+        "text": "Great! Now let's find the perfect property for you, [Customer Name]."
       }}
     }},
     {{
@@ -259,8 +258,13 @@ For questions beyond available data (detailed payment plans, legal documentation
 ====================================================
 📦 AVAILABLE PROJECTS
 ====================================================
+All projects (one summary per line):
 {projects}
 
+Images, floor plans, amenities and other details are only given for the
+projects in the "CURRENT LEAD STATUS" message. If the customer asks about
+another project, use its summary and offer the project link.
+
 ====================================================
 📝 RESPONSE FORMAT
 ====================================================
@@ -286,4 +290,42 @@ For questions beyond available data (detailed payment plans, legal documentation
 **ALWAYS:** Be human, professional, helpful, trustworthy
 
 Always return valid JSON with "blocks" array.
-"""
\ No newline at end of file
+"""
+
+LEAD_STATUS_PROMPT = """
+CURRENT LEAD STATUS
+- Stage: {stage}
+- Name: {name}
+- Phone: {phone}
+- Phone Verified: {phone_verified}
+- Interested Project: {project_name}
+- Lead Submitted: {lead_submitted}
+
+**Full details of the projects most relevant to this conversation:**
+{project_details}
+"""
+
+# Static prompt per catalog version. Nothing lead-specific goes in here, so the
+# prefix stays byte-identical across sessions and provider prompt caching hits.
+_static_prompt_cache = {"version": None, "prompt": None}
+
+
+def build_static_prompt(catalog_version, projects):
+    """Instructions plus catalog summary, formatted once per catalog version"""
+    if _static_prompt_cache["prompt"] is None or _static_prompt_cache["version"] != catalog_version:
+        _static_prompt_cache["prompt"] = STATIC_SYSTEM_PROMPT.format(projects=render_catalog_summary(projects))
+        _static_prompt_cache["version"] = catalog_version
+    return _static_prompt_cache["prompt"]
+
+
+def build_lead_status_prompt(lead_data, stage, relevant_projects):
+    """Small per-turn message with the lead state and the selected projects"""
+    return LEAD_STATUS_PROMPT.format(
+        stage=stage,
+        name=lead_data.get('name') or 'NOT CAPTURED',
+        phone=lead_data.get('phone') or 'NOT CAPTURED',
+        phone_verified=lead_data.get('phone_verified', False),
+        project_name=lead_data.get('interested_project_name') or 'NOT IDENTIFIED',
+        lead_submitted=lead_data.get('lead_submitted', False),
+        project_details=render_project_details(relevant_projects)
+    )
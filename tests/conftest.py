@@ -0,0 +1,106 @@
+# tests/conftest.py
+"""
+Shared fixtures. The app modules live at the repo root, so it goes on sys.path.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeRespServer:
+    """Tiny RESP2 server with the commands the OTP store uses (GET, SET EX, DEL,
+    INCR, EXPIRE). Keys expire on a clock the test moves with advance(), and
+    errors[command] makes that command answer with an error reply.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.errors = {}
+        self.offset = 0.0
+        self._lock = threading.Lock()
+        self._sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+    def close(self):
+        self._sock.close()
+
+    def _now(self):
+        return time.monotonic() + self.offset
+
+    def _alive(self, key):
+        if key in self.expires and self.expires[key] <= self._now():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        reader = conn.makefile("rb")
+        with conn:
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int(reader.readline()[1:])
+                    args.append(reader.read(size + 2)[:-2].decode())
+                with self._lock:
+                    reply = self._run(args[0].upper(), args[1:])
+                conn.sendall(reply)
+
+    def _run(self, cmd, args):
+        if cmd in self.errors:
+            return f"-{self.errors[cmd]}\r\n".encode()
+        if cmd == "GET":
+            value = self.data[args[0]] if self._alive(args[0]) else None
+            return b"$-1\r\n" if value is None else f"${len(value.encode())}\r\n{value}\r\n".encode()
+        if cmd == "SET":
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            if len(args) >= 4 and args[2].upper() == "EX":
+                self.expires[args[0]] = self._now() + int(args[3])
+            return b"+OK\r\n"
+        if cmd == "DEL":
+            removed = 0
+            for key in args:
+                if self._alive(key):
+                    del self.data[key]
+                    self.expires.pop(key, None)
+                    removed += 1
+            return f":{removed}\r\n".encode()
+        if cmd == "INCR":
+            value = int(self.data[args[0]]) + 1 if self._alive(args[0]) else 1
+            self.data[args[0]] = str(value)
+            return f":{value}\r\n".encode()
+        if cmd == "EXPIRE":
+            if not self._alive(args[0]):
+                return b":0\r\n"
+            self.expires[args[0]] = self._now() + int(args[1])
+            return b":1\r\n"
+        return f"-ERR unknown command '{cmd}'\r\n".encode()
+
+
+@pytest.fixture
+def resp_server():
+    server = FakeRespServer()
+    yield server
+    server.close()
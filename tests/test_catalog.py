@@ -0,0 +1,141 @@
+import hashlib
+import http.server
+import json
+import threading
+
+import pytest
+
+import tools
+
+CATALOG = {"data": [
+    {"_id": "p1", "name": "Amogh Residency", "slug": "amogh-residency-49", "city": "Gurugram",
+     "price": "1.2 Cr", "typebhk": [{"bhktype": "3 BHK"}], "possession": "Dec 2026"},
+    {"_id": "p2", "name": "Skyline Towers", "slug": "skyline-67", "city": "Gurugram",
+     "price": "85 Lakhs", "typebhk": [{"bhktype": "2 BHK"}], "possession": "Ready to Move"},
+]}
+
+
+class StubCatalogApi(http.server.ThreadingHTTPServer):
+    """Serves `body` with an ETag of its hash and answers 304 to a matching If-None-Match"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.body = json.loads(json.dumps(CATALOG))
+        self.requests = []  # If-None-Match of each request
+        self.down = False
+
+    def payload(self):
+        raw = json.dumps(self.body).encode()
+        return raw, f'"{hashlib.sha1(raw).hexdigest()[:8]}"'
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.server.down:
+            self.send_response(500)
+            self.end_headers()
+            return
+        raw, etag = self.server.payload()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    server = StubCatalogApi()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(tools, "CATALOG_API_URL", f"http://127.0.0.1:{server.server_address[1]}/api/projects")
+    monkeypatch.setattr(tools, "CATALOG_SNAPSHOT_FILE", str(tmp_path / "catalog_snapshot.json"))
+    monkeypatch.setattr(tools, "_catalog_cache", {
+        "projects": None, "version": None, "fetched_at": 0.0, "error": None,
+        "etag": None, "last_modified": None, "body_hash": None,
+    })
+    monkeypatch.setattr(tools, "_catalog_listeners", [])
+    monkeypatch.setattr(tools, "start_catalog_refresher", lambda: None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _forget_catalog():
+    """What a restarted worker sees: an empty in-memory cache"""
+    tools._catalog_cache.update(projects=None, version=None, fetched_at=0.0, etag=None, body_hash=None)
+
+
+def test_unchanged_catalog_is_revalidated_with_304(api):
+    assert tools.refresh_catalog()
+    projects, version = tools.get_catalog()
+    assert [p.id for p in projects] == ["p1", "p2"]
+
+    assert tools.refresh_catalog()
+    assert api.requests == [None, api.payload()[1]]
+    assert tools.get_catalog() == (projects, version)
+    # A 304 keeps the very same list, it is not re-parsed
+    assert tools.get_catalog()[0] is projects
+
+
+def test_changed_catalog_gets_new_version_and_notifies(api):
+    tools.refresh_catalog()
+    _, old_version = tools.get_catalog()
+    seen = []
+    tools.add_catalog_listener(seen.append)
+
+    api.body["data"][0]["price"] = "1.3 Cr"
+    tools.refresh_catalog()
+    projects, version = tools.get_catalog()
+
+    assert version != old_version
+    assert projects[0].price_range == "1.3 Cr"
+    assert seen == [version]
+
+
+def test_snapshot_restores_catalog_and_validators(api):
+    tools.refresh_catalog()
+    projects, version = tools.get_catalog()
+
+    _forget_catalog()
+    assert tools.load_catalog_snapshot()
+    assert tools.get_catalog() == (projects, version)
+
+    # The restored ETag lets the first refresh after a restart be a 304
+    tools.refresh_catalog()
+    assert api.requests[-1] == api.payload()[1]
+    assert tools.get_catalog()[1] == version
+
+
+def test_cold_start_serves_fresh_snapshot_without_fetching(api):
+    tools.refresh_catalog()
+    _, version = tools.get_catalog()
+    requests_before = len(api.requests)
+
+    _forget_catalog()
+    assert tools.get_catalog()[1] == version
+    assert len(api.requests) == requests_before
+
+
+def test_unreadable_snapshot_is_ignored(api):
+    with open(tools.CATALOG_SNAPSHOT_FILE, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert not tools.load_catalog_snapshot()
+
+
+def test_failed_refresh_keeps_previous_catalog(api):
+    tools.refresh_catalog()
+    catalog = tools.get_catalog()
+
+    api.down = True
+    assert not tools.refresh_catalog()
+    assert tools.get_catalog() == catalog
+    assert tools._catalog_cache["error"]
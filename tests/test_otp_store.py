@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from otp_store import InMemoryOtpStore, RespOtpStore, OTP_OK, OTP_MISSING, OTP_MISMATCH, OTP_LOCKED
+from resp_client import RespClient, RespError
+
+PHONE = "9876543210"
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        return InMemoryOtpStore(ttl=300, max_attempts=3)
+    server = request.getfixturevalue("resp_server")
+    return RespOtpStore(RespClient(port=server.port), ttl=300, max_attempts=3)
+
+
+def test_correct_code_verifies_once(store):
+    store.put(PHONE, "123456")
+    assert store.verify(PHONE, "123456") == OTP_OK
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+
+
+def test_unknown_phone_is_missing(store):
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+
+
+def test_wrong_code_then_right_code(store):
+    store.put(PHONE, "123456")
+    assert store.verify(PHONE, "000000") == OTP_MISMATCH
+    assert store.verify(PHONE, "123456") == OTP_OK
+
+
+def test_too_many_wrong_guesses_burn_the_code(store):
+    store.put(PHONE, "123456")
+    assert store.verify(PHONE, "000000") == OTP_MISMATCH
+    assert store.verify(PHONE, "000001") == OTP_MISMATCH
+    assert store.verify(PHONE, "000002") == OTP_LOCKED
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+
+
+def test_new_code_resets_attempts(store):
+    store.put(PHONE, "123456")
+    store.verify(PHONE, "000000")
+    store.verify(PHONE, "000001")
+    store.put(PHONE, "654321")
+    assert store.verify(PHONE, "000000") == OTP_MISMATCH
+    assert store.verify(PHONE, "654321") == OTP_OK
+
+
+def test_concurrent_verify_accepts_the_code_once(store):
+    store.put(PHONE, "123456")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: store.verify(PHONE, "123456"), range(8)))
+    assert results.count(OTP_OK) == 1
+
+
+def test_memory_code_expires():
+    store = InMemoryOtpStore(ttl=0)
+    store.put(PHONE, "123456")
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+    assert len(store) == 0
+
+
+def test_memory_store_is_capped():
+    store = InMemoryOtpStore(max_entries=2)
+    for i in range(3):
+        store.put(f"98765432{i:02d}", "123456")
+    assert len(store) == 2
+    assert store.verify("9876543200", "123456") == OTP_MISSING
+
+
+def test_resp_code_expires(resp_server):
+    store = RespOtpStore(RespClient(port=resp_server.port), ttl=300)
+    store.put(PHONE, "123456")
+    resp_server.advance(301)
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+
+
+def test_resp_put_raises_on_error_reply(resp_server):
+    store = RespOtpStore(RespClient(port=resp_server.port))
+    resp_server.errors["SET"] = "OOM command not allowed when used memory > 'maxmemory'"
+    with pytest.raises(RespError):
+        store.put(PHONE, "123456")
+
+
+def test_resp_verify_raises_on_error_reply(resp_server):
+    store = RespOtpStore(RespClient(port=resp_server.port))
+    store.put(PHONE, "123456")
+    resp_server.errors["INCR"] = "READONLY You can't write against a read only replica."
+    with pytest.raises(RespError):
+        store.verify(PHONE, "000000")
+
+
+def test_memory_verify_sweeps_expired_codes():
+    store = InMemoryOtpStore(ttl=0, sweep_interval=3600)
+    store.put("9876543200", "123456")
+    store.put("9876543201", "123456")
+    assert len(store) == 2
+    store.sweep_interval = 0
+    assert store.verify(PHONE, "123456") == OTP_MISSING
+    assert len(store) == 0
@@ -0,0 +1,132 @@
+import pytest
+
+import stage_machine
+from stage_machine import (
+    Message, Transition, TRANSITIONS, advance, compile_transitions, find_unreachable_stages
+)
+from session_store import LeadRecord
+
+PHONE = "9876543210"
+
+
+@pytest.fixture
+def otp(monkeypatch):
+    """send_otp/verify_otp stand-ins: every send succeeds, "123456" is the right code"""
+    sent = []
+    monkeypatch.setattr(stage_machine, "send_otp", lambda phone: sent.append(phone) or {"status": "success"})
+    monkeypatch.setattr(stage_machine, "verify_otp",
+                        lambda phone, code: {"status": "success" if code == "123456" else "error"})
+    return sent
+
+
+def _lead(customer_type="new", name=None, phone=None):
+    lead = LeadRecord()
+    lead["customer_type"] = customer_type
+    lead["name"] = name
+    lead["phone"] = phone
+    return lead
+
+
+def _step(stage, text, lead):
+    return advance(stage, Message(text), lead)
+
+
+def test_customer_type_option():
+    lead = LeadRecord()
+    assert _step("INITIAL", "I'm a new guest", lead) == "CUSTOMER_TYPE_SELECTED"
+    assert lead["customer_type"] == "new"
+    lead = LeadRecord()
+    assert _step("INITIAL", "I'm an existing client", lead) == "CUSTOMER_TYPE_SELECTED"
+    assert lead["customer_type"] == "existing"
+
+
+@pytest.mark.parametrize("text, name", [
+    ("Rahul", "Rahul"),
+    ("my name is rahul sharma", "Rahul Sharma"),
+    ("राहुल", "राहुल"),
+    ("I'm José", "José"),
+])
+def test_new_guest_gives_name(text, name):
+    lead = _lead()
+    assert _step("CUSTOMER_TYPE_SELECTED", text, lead) == "NAME_COLLECTED"
+    assert lead["name"] == name
+
+
+@pytest.mark.parametrize("text", ["what is the price?", "Sector 102 3BHK", "show me plots"])
+def test_new_guest_question_is_not_a_name(text):
+    lead = _lead()
+    assert _step("CUSTOMER_TYPE_SELECTED", text, lead) == "CUSTOMER_TYPE_SELECTED"
+    assert lead["name"] is None
+
+
+def test_existing_client_free_text_is_not_a_name():
+    lead = _lead("existing")
+    assert _step("CUSTOMER_TYPE_SELECTED", "Site visit", lead) == "CUSTOMER_TYPE_SELECTED"
+    assert lead["name"] is None
+    assert _step("CUSTOMER_TYPE_SELECTED", "My name is Priya", lead) == "NAME_COLLECTED"
+    assert lead["name"] == "Priya"
+
+
+@pytest.mark.parametrize("text", [
+    "Sector 102 3BHK",
+    "I want a 3 BHK around 1500 sqft",
+    "2 bhk under 1.5 cr in sector 49",
+])
+def test_requirements_with_digits_are_not_a_phone(otp, text):
+    lead = _lead(name="Rahul")
+    assert _step("NAME_COLLECTED", text, lead) == "NAME_COLLECTED"
+    assert not otp
+
+
+@pytest.mark.parametrize("text", ["98765", "98765-432", "+91 98765"])
+def test_partial_phone_is_invalid(otp, text):
+    lead = _lead(name="Rahul")
+    assert _step("NAME_COLLECTED", text, lead) == "PHONE_INVALID"
+    assert lead["phone"] is None
+    assert not otp
+
+
+def test_phone_then_otp(otp):
+    lead = _lead(name="Rahul")
+    assert _step("NAME_COLLECTED", "+91 98765 43210", lead) == "OTP_SENT"
+    assert lead["phone"] == PHONE and otp == [PHONE]
+    assert _step("OTP_SENT", "123456", lead) == "VERIFIED"
+    assert lead["phone_verified"]
+
+
+def test_phone_after_invalid_attempt(otp):
+    lead = _lead(name="Rahul")
+    assert _step("NAME_COLLECTED", "98765", lead) == "PHONE_INVALID"
+    assert _step("PHONE_INVALID", PHONE, lead) == "OTP_SENT"
+
+
+def test_edited_number_at_otp_sent(otp):
+    lead = _lead(name="Rahul", phone=PHONE)
+    assert _step("OTP_SENT", "9123456780", lead) == "OTP_SENT"
+    assert lead["phone"] == "9123456780"
+    assert otp == ["9123456780"]
+
+
+def test_wrong_otp_then_retry(otp):
+    lead = _lead(name="Rahul", phone=PHONE)
+    assert _step("OTP_SENT", "000000", lead) == "OTP_INVALID"
+    assert _step("OTP_INVALID", "111111", lead) == "OTP_INVALID"
+    assert _step("OTP_INVALID", "123456", lead) == "VERIFIED"
+
+
+def test_table_is_valid():
+    assert find_unreachable_stages() == []
+    assert set(compile_transitions()) == set(stage_machine.STAGES)
+
+
+def test_compile_rejects_unknown_stage():
+    table = TRANSITIONS + (Transition("typo", ("OTP_SENT",), lambda m, l: None, None, ("VERIFED",)),)
+    with pytest.raises(ValueError, match="VERIFED"):
+        compile_transitions(table)
+
+
+def test_dead_stage_is_unreachable():
+    stages = stage_machine.STAGES + ("CALLBACK_REQUESTED",)
+    assert find_unreachable_stages(TRANSITIONS, stages) == ["CALLBACK_REQUESTED"]
+    with pytest.raises(ValueError, match="CALLBACK_REQUESTED"):
+        compile_transitions(TRANSITIONS, stages)
@@ -1,87 +1,373 @@
 # tools.py
-import requests
+import http_client
+import asyncio
 import json
+import math
 import random
+import hashlib
+import os
+import threading
+import time
+from project_models import Project
+from otp_store import get_otp_store, OTP_OK, OTP_LOCKED, OTP_MISMATCH
+from rate_limit import otp_phone_limiter
 
-def get_projects(search_query=""):
-    """Fetch all projects from API"""
-    url = f"https://www.amoghbuildtech.com/api/projects?search={search_query}&page=1&pageSize=1000&propertyCategory=All&country=india&isComplete=true&priceRange=all"
+# =========================
+# PROJECT CATALOG
+# =========================
+CATALOG_API_URL = os.environ.get("CATALOG_API_URL", "https://www.amoghbuildtech.com/api/projects")
+
+# How long a fetched catalog is considered fresh. Stale data keeps being served
+# while a refresh runs in the background.
+CATALOG_TTL_SECONDS = int(os.environ.get("CATALOG_TTL_SECONDS", "300"))
+CATALOG_REFRESH_INTERVAL = int(os.environ.get("CATALOG_REFRESH_INTERVAL", str(CATALOG_TTL_SECONDS)))
+
+# Processed catalog persisted across restarts so a cold worker can serve
+# immediately and revalidate in the background.
+CATALOG_SNAPSHOT_FILE = os.environ.get("CATALOG_SNAPSHOT_FILE", "catalog_snapshot.json")
+CATALOG_SNAPSHOT_FORMAT = 2
+
+_catalog_lock = threading.Lock()
+_catalog_refresh_lock = threading.Lock()
+_catalog_cache = {
+    "projects": None,    # list of Project records
+    "version": None,     # content hash of the processed list
+    "fetched_at": 0.0,   # time.monotonic() of the last successful fetch
+    "error": None,       # last fetch error message, if any
+    # Validators of the last successful fetch, used for conditional requests
+    "etag": None,
+    "last_modified": None,
+    "body_hash": None,
+}
+_refresher_thread = None
+_catalog_listeners = []
+
+
+def _catalog_params(search_query=""):
+    return {
+        "search": search_query,
+        "page": 1,
+        "pageSize": 1000,
+        "propertyCategory": "All",
+        "country": "india",
+        "isComplete": "true",
+        "priceRange": "all",
+    }
+
+
+def fetch_projects(search_query=""):
+    """Fetch and process projects from the API (always hits the network).
+
+    Returns the processed project list, or raises on any API/network error.
+    """
+    print("📄 Fetching projects from API...")
+    response = http_client.get(CATALOG_API_URL, params=_catalog_params(search_query))
+    
+    if response.status_code != 200:
+        raise RuntimeError(f"API not responding (status {response.status_code})")
+    
+    projects = response.json().get("data", [])
+    processed_data = [Project.from_api(p) for p in projects]
+    
+    print(f"✅ Successfully fetched {len(processed_data)} projects")
+    return processed_data
+
+
+def _fetch_catalog_if_changed(etag=None, last_modified=None, body_hash=None):
+    """Conditionally fetch the full catalog.
+
+    Sends If-None-Match / If-Modified-Since from the previous fetch. Returns
+    (None, validators) when the catalog is unchanged - either a 304 or a 200
+    whose body hashes the same - so unchanged data is never re-parsed.
+    Otherwise returns (processed_projects, validators). Raises on errors.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    
+    print("📄 Revalidating project catalog..." if headers or body_hash else "📄 Fetching projects from API...")
+    response = http_client.get(CATALOG_API_URL, params=_catalog_params(), headers=headers)
+    
+    if response.status_code == 304:
+        print("✅ Catalog not modified (304)")
+        return None, {"etag": etag, "last_modified": last_modified, "body_hash": body_hash}
+    
+    if response.status_code != 200:
+        raise RuntimeError(f"API not responding (status {response.status_code})")
+    
+    validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "body_hash": hashlib.sha1(response.content).hexdigest(),
+    }
+    if body_hash and validators["body_hash"] == body_hash:
+        print("✅ Catalog unchanged (same content hash)")
+        return None, validators
+    
+    projects = response.json().get("data", [])
+    processed_data = [Project.from_api(p) for p in projects]
+    
+    print(f"✅ Successfully fetched {len(processed_data)} projects")
+    return processed_data, validators
+
+
+def _catalog_version(projects):
+    """Stable content hash of a processed catalog"""
+    payload = json.dumps([p.to_dict() for p in projects], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:12]
+
+
+def load_catalog_snapshot(path=None):
+    """Load the on-disk catalog snapshot into an empty cache.
+
+    The snapshot keeps its age: one saved within the TTL is served as fresh,
+    an older one is served as stale and revalidated in the background.
+    Returns True if a snapshot was loaded.
+    """
+    path = path or CATALOG_SNAPSHOT_FILE
+    if not os.path.exists(path):
+        return False
     
     try:
-        print("📄 Fetching projects from API...")
-        response = requests.get(url, timeout=10)
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable catalog snapshot: {str(e)}")
+        return False
+    
+    if snapshot.get("format") != CATALOG_SNAPSHOT_FORMAT or not isinstance(snapshot.get("projects"), list):
+        print("⚠️ Ignoring catalog snapshot with unknown format")
+        return False
+    
+    try:
+        projects = [Project.from_dict(d) for d in snapshot["projects"]]
+    except Exception as e:
+        print(f"⚠️ Ignoring corrupt catalog snapshot: {str(e)}")
+        return False
+    
+    age = max(0.0, time.time() - snapshot.get("saved_at", 0))
+    with _catalog_lock:
+        if _catalog_cache["projects"] is not None:
+            return False
+        _catalog_cache["projects"] = projects
+        _catalog_cache["version"] = snapshot.get("version") or _catalog_version(projects)
+        _catalog_cache["fetched_at"] = time.monotonic() - age
+        _catalog_cache["etag"] = snapshot.get("etag")
+        _catalog_cache["last_modified"] = snapshot.get("last_modified")
+        _catalog_cache["body_hash"] = snapshot.get("body_hash")
+    
+    print(f"💾 Loaded catalog snapshot (version {_catalog_cache['version']}, {len(projects)} projects, {int(age)}s old)")
+    return True
+
+
+def save_catalog_snapshot(path=None):
+    """Atomically write the cached catalog to disk"""
+    path = path or CATALOG_SNAPSHOT_FILE
+    with _catalog_lock:
+        if _catalog_cache["projects"] is None:
+            return False
+        snapshot = {
+            "format": CATALOG_SNAPSHOT_FORMAT,
+            "version": _catalog_cache["version"],
+            "saved_at": time.time(),
+            "etag": _catalog_cache["etag"],
+            "last_modified": _catalog_cache["last_modified"],
+            "body_hash": _catalog_cache["body_hash"],
+            "projects": [p.to_dict() for p in _catalog_cache["projects"]],
+        }
+    
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ Could not save catalog snapshot: {str(e)}")
+        return False
+    return True
+
+
+def refresh_catalog(wait=False):
+    """Revalidate the catalog against the API and swap it into the cache.
+
+    Only one refresh runs at a time. Concurrent callers return immediately,
+    or with wait=True block until the running refresh is done (and reuse its
+    result instead of fetching again). On failure the previous catalog is
+    kept and the error is recorded. Returns True if the cache holds a
+    catalog that was confirmed or updated by this call.
+    """
+    if not _catalog_refresh_lock.acquire(blocking=False):
+        if not wait:
+            return False
+        with _catalog_refresh_lock:
+            pass
+        with _catalog_lock:
+            return _catalog_cache["projects"] is not None
+    
+    try:
+        with _catalog_lock:
+            have_catalog = _catalog_cache["projects"] is not None
+            validators = {
+                "etag": _catalog_cache["etag"],
+                "last_modified": _catalog_cache["last_modified"],
+                "body_hash": _catalog_cache["body_hash"],
+            } if have_catalog else {}
         
-        if response.status_code == 200:
-            raw_data = response.json()
-            projects = raw_data.get("data", [])
-            
-            if not projects:
-                print("⚠️ No projects found")
-                return "No projects found matching your criteria."
-            
-            processed_data = []
-            for p in projects:
-                bhk_options = [b.get("bhktype") for b in p.get("typebhk", [])]
-                
-                # Extract images from bannerimg array
-                images = []
-                banner_images = p.get("bannerimg", [])
-                for img_name in banner_images[:8]:  # Get up to 8 images
-                    if img_name:
-                        # Direct API URL without Next.js image optimization
-                        images.append(f"https://www.amoghbuildtech.com/api/images/{img_name}")
-                
-                # Also get floor plans, site plans, and site maps
-                floor_plans = []
-                for fp in p.get("typebhk", []):
-                    if fp.get("img"):
-                        floor_plans.append({
-                            "type": fp.get("bhktype"),
-                            "url": f"https://www.amoghbuildtech.com/api/images/{fp['img']}"
-                        })
-                
-                site_plans = [f"https://www.amoghbuildtech.com/api/images/{sp}" for sp in p.get("sitePlan", []) if sp]
-                site_maps = [f"https://www.amoghbuildtech.com/api/images/{sm}" for sm in p.get("siteMap", []) if sm]
-                
-                
-                info = {
-                    "id": p.get("_id"),
-                    "name": p.get("name"),
-                    "slug": project_slug,
-                    "link": project_link,
-                    "location": f"{p.get('city')}, Sector {p.get('slug').split('-')[-2] if '-' in p.get('slug', '') else 'N/A'}",
-                    "price_range": p.get("price"),
-                    "configurations": bhk_options,
-                    "possession": p.get("possession"),
-                    "size": p.get("projectarea", "N/A"),
-                    "images": images,
-                    "floor_plans": floor_plans,
-                    "site_plans": site_plans,
-                    "site_maps": site_maps,
-                    "amenities": p.get("amenities", [])[:20],  # First 20 amenities IDs
-                    "key_features": p.get("keyfeatures", []),
-                    "highlights": p.get("highlight", []),
-                    "rera_id": p.get("reraId", "N/A"),
-                    "status": p.get("status", "N/A"),
-                    "towers": p.get("towers", "N/A"),
-                    "units": p.get("units", "N/A"),
-                    "floors": p.get("floors", []),
-                    "total_area": p.get("totalProjectArea", {})
-                }
-                processed_data.append(info)
-            
-            print(f"✅ Successfully fetched {len(processed_data)} projects")
-            return str(processed_data)
-        else:
-            print(f"❌ API Error: Status {response.status_code}")
-            return "Error: API not responding."
-            
+        try:
+            projects, validators = _fetch_catalog_if_changed(**validators)
+        except Exception as e:
+            print(f"❌ Catalog refresh failed: {str(e)}")
+            with _catalog_lock:
+                _catalog_cache["error"] = str(e)
+            return False
+        
+        changed = False
+        with _catalog_lock:
+            if projects is not None:
+                version = _catalog_version(projects)
+                changed = version != _catalog_cache["version"]
+                if changed:
+                    print(f"🔄 Catalog updated (version {version})")
+                _catalog_cache["projects"] = projects
+                _catalog_cache["version"] = version
+            _catalog_cache.update(validators)
+            _catalog_cache["fetched_at"] = time.monotonic()
+            _catalog_cache["error"] = None
+        
+        if projects is not None:
+            save_catalog_snapshot()
+        if changed:
+            _notify_catalog_listeners(version)
+        return True
+    finally:
+        _catalog_refresh_lock.release()
+
+
+def add_catalog_listener(callback):
+    """Call callback(version) whenever a refresh brings in a changed catalog"""
+    _catalog_listeners.append(callback)
+
+
+def _notify_catalog_listeners(version):
+    for callback in list(_catalog_listeners):
+        try:
+            callback(version)
+        except Exception as e:
+            print(f"⚠️ Catalog listener failed: {str(e)}")
+
+
+def _refresh_in_background():
+    """Kick off a one-shot refresh without blocking the caller"""
+    if _catalog_refresh_lock.locked():
+        return
+    threading.Thread(target=refresh_catalog, name="catalog-refresh", daemon=True).start()
+
+
+def _refresher_loop():
+    while True:
+        time.sleep(max(CATALOG_REFRESH_INTERVAL, 1))
+        refresh_catalog()
+
+
+def start_catalog_refresher():
+    """Start the periodic background refresher (idempotent)"""
+    global _refresher_thread
+    
+    with _catalog_lock:
+        if _refresher_thread is not None and _refresher_thread.is_alive():
+            return _refresher_thread
+        _refresher_thread = threading.Thread(target=_refresher_loop, name="catalog-refresher", daemon=True)
+        _refresher_thread.start()
+    
+    print(f"⏱️ Catalog refresher started (every {CATALOG_REFRESH_INTERVAL}s)")
+    return _refresher_thread
+
+
+def get_catalog_version():
+    """Version hash of the cached catalog, or None before the first fetch"""
+    with _catalog_lock:
+        return _catalog_cache["version"]
+
+
+def _read_catalog():
+    """(projects, version, age) in one locked read, so the version always belongs to the projects"""
+    with _catalog_lock:
+        return _catalog_cache["projects"], _catalog_cache["version"], time.monotonic() - _catalog_cache["fetched_at"]
+
+
+def get_catalog():
+    """Get all projects and the catalog version as (projects, version).
+
+    Served from the process-wide catalog cache: fresh data is returned as-is,
+    stale data is returned immediately while a background refresh runs. On a
+    cold start the on-disk snapshot is used when present; only a first boot
+    without one waits on the API. Returns ([], None) when no catalog is
+    available.
+    """
+    projects, version, age = _read_catalog()
+    
+    if projects is None:
+        # Cold start: serve the on-disk snapshot if there is one, otherwise
+        # this call has to wait for the API
+        if not load_catalog_snapshot():
+            refresh_catalog(wait=True)
+        start_catalog_refresher()
+        projects, version, age = _read_catalog()
+        if projects is None:
+            print("⚠️ No project catalog available")
+            return [], None
+    
+    if age > CATALOG_TTL_SECONDS:
+        _refresh_in_background()
+    
+    if not projects:
+        print("⚠️ No projects found")
+    
+    return projects, version
+
+
+async def get_catalog_async():
+    """Async get_catalog for the ASGI app.
+
+    A warm cache is returned without leaving the event loop; a cold start
+    runs the blocking fetch in a worker thread.
+    """
+    projects, version, age = _read_catalog()
+    if projects is not None:
+        if age > CATALOG_TTL_SECONDS:
+            _refresh_in_background()
+        return projects, version
+    return await asyncio.to_thread(get_catalog)
+
+
+def get_projects(search_query=""):
+    """Get all projects as a list of Project records.
+
+    Without a search this is the cached catalog (see get_catalog); searches
+    bypass the cache. Returns an empty list when nothing is available.
+    """
+    if not search_query:
+        return get_catalog()[0]
+    try:
+        projects = fetch_projects(search_query)
     except Exception as e:
         print(f"❌ Network Error: {str(e)}")
-        return f"Network Error: {str(e)}"
+        return []
+    if not projects:
+        print("⚠️ No projects found")
+    return projects
+
+
+async def get_projects_async(search_query=""):
+    """Async get_projects for the ASGI app"""
+    if not search_query:
+        return (await get_catalog_async())[0]
+    return await asyncio.to_thread(get_projects, search_query)
 
 
-def add_lead_to_crm(name, phone, project_id, remarks="Customer showed interest via AI chatbot"):
+def add_lead_to_crm(name, phone, project_id, remarks="Customer showed interest via AI chatbot", idempotency_key=None):
     """Submit lead to CRM system"""
     
     url = "https://uat-service.amoghbuildtech.com/v1/customer"
@@ -113,7 +399,9 @@ def add_lead_to_crm(name, phone, project_id, remarks="Customer showed interest v
     print("="*60 + "\n")
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        # Same key on every retry of one lead, for CRMs that deduplicate on it
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response = http_client.post(url, json=payload, headers=headers)
         
         print(f"📨 CRM API STATUS CODE: {response.status_code}")
         print(f"📨 CRM API RESPONSE:")
@@ -136,6 +424,7 @@ def add_lead_to_crm(name, phone, project_id, remarks="Customer showed interest v
             return {
                 "status": "error", 
                 "message": f"Failed with status {response.status_code}",
+                "response_code": response.status_code,
                 "response": response.text[:200]
             }
             
@@ -144,16 +433,30 @@ def add_lead_to_crm(name, phone, project_id, remarks="Customer showed interest v
         return {"status": "error", "message": str(e)}
 
 
-# OTP Storage (in production, use Redis or database)
-otp_storage = {}
-
+# OTPs expire, allow a few attempts and are shared across workers with
+# OTP_STORE=redis (see otp_store.py)
 def send_otp(phone):
     """Send OTP to phone via WhatsApp"""
+    # Each OTP costs a WhatsApp message; cap how often one number can get them
+    allowed, retry_after = otp_phone_limiter.check(phone)
+    if not allowed:
+        return {
+            "status": "error",
+            "message": f"Too many OTP requests. Please try again in {math.ceil(retry_after / 60)} minute(s)."
+        }
+    
     # Generate 6-digit OTP
     otp = str(random.randint(100000, 999999))
     
-    # Store OTP (in production, use Redis with TTL)
-    otp_storage[phone] = otp
+    # Store OTP (expires after OTP_TTL_SECONDS)
+    try:
+        get_otp_store().put(phone, otp)
+    except Exception as e:
+        print(f"❌ Failed to store OTP: {str(e)}")
+        return {
+            "status": "error",
+            "message": "Could not send OTP right now. Please try again."
+        }
     
     print(f"\n📱 SENDING OTP TO: +91 {phone}")
     print(f"🔢 OTP GENERATED: {otp}")
@@ -193,26 +496,37 @@ def verify_otp(phone, otp):
     print(f"   Phone: {phone}")
     print(f"   OTP Entered: {otp}")
     
-    stored_otp = otp_storage.get(phone)
-    
-    if not stored_otp:
-        print("❌ No OTP found for this number")
+    try:
+        result = get_otp_store().verify(phone, otp)
+    except Exception as e:
+        print(f"❌ OTP store error: {str(e)}")
         return {
             "status": "error",
-            "message": "No OTP found. Please request a new one."
+            "message": "Could not verify OTP right now. Please try again."
         }
     
-    if stored_otp == otp:
-        # Clear OTP after successful verification
-        del otp_storage[phone]
+    if result == OTP_OK:
+        # The store deletes the OTP on success, so it can't be reused
         print("✅ OTP verified successfully")
         return {
             "status": "success",
             "message": "Phone number verified successfully"
         }
-    else:
-        print(f"❌ OTP mismatch. Expected: {stored_otp}, Got: {otp}")
+    elif result == OTP_MISMATCH:
+        print("❌ OTP mismatch")
         return {
             "status": "error",
             "message": "Invalid OTP. Please try again."
+        }
+    elif result == OTP_LOCKED:
+        print("❌ Too many wrong OTP attempts")
+        return {
+            "status": "error",
+            "message": "Too many incorrect attempts. Please request a new OTP."
+        }
+    else:
+        print("❌ No OTP found for this number")
+        return {
+            "status": "error",
+            "message": "No OTP found or it has expired. Please request a new one."
         }
\ No newline at end of file